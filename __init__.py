@@ -1,5 +1,12 @@
 from __future__ import division, print_function, absolute_import
 __author__ = 'Parke Loyd'
 
-from .scicatalog import SciCatalog
-from . import export
\ No newline at end of file
+from .scicatalog import SciCatalog, quickval, quickvals, iterchunks, convert
+from . import export
+from . import storage
+from . import locking
+from . import spool
+from . import cache
+from . import refdict
+from . import view
+from . import propagate
@@ -0,0 +1,80 @@
+"""
+Regression benchmark for export.aastex: renders the same synthetic table with the column-wise (vectorize=True) and
+item-by-item (vectorize=False) number formatting, checks that the output is byte-for-byte identical, and reports the
+time taken by each.
+
+Usage: python bench_aastex.py [nrows] [ncols] [seed]
+"""
+from __future__ import division, print_function, absolute_import
+import os
+import sys
+import time
+import tempfile
+import importlib
+import numpy as np
+
+# the repository directory is the package, so import it by name from its parent directory
+pkgdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(pkgdir))
+export = importlib.import_module(os.path.basename(pkgdir) + '.export')
+
+
+def synthetic_table(nrows, ncols, seed=0):
+    """
+    Values spanning many orders of magnitude with symmetric and asymmetric errors, plus the awkward cases: nulls,
+    upper and lower limits, zeros, ints, round numbers, strings, and errors that are exact powers of ten.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (nrows, ncols)
+    values = rng.normal(size=shape) * 10**rng.uniform(-6, 6, size=shape)
+    errneg = np.abs(values) * 10**rng.uniform(-5, -0.3, size=shape)
+    errpos = np.where(rng.random(shape) < 0.5, errneg, errneg * rng.uniform(0.5, 2, size=shape))
+
+    r = rng.random(shape)
+    values = np.where((r > 0.1) & (r < 0.15) & (np.abs(values) > 1), np.round(values, 2), values)
+    values = np.where((r > 0.15) & (r < 0.2), rng.uniform(-9.99, -1, size=shape), values)
+    pow10 = 10.**np.floor(np.log10(np.abs(values)) - rng.integers(1, 4, size=shape))
+    errneg = np.where((r < 0.1) | (r > 0.15) & (r < 0.2), pow10, errneg)
+    errpos = np.where((r < 0.1) | (r > 0.15) & (r < 0.2), pow10, errpos)
+    upper, lower, nodata = (r > 0.2) & (r < 0.23), (r > 0.23) & (r < 0.25), (r > 0.25) & (r < 0.28)
+    values[upper | lower | nodata] = np.nan
+    errneg[upper | nodata] = np.nan
+    errpos[lower | nodata] = np.nan
+
+    values, errneg, errpos = values.tolist(), errneg.tolist(), errpos.tolist()
+    for i in range(nrows):
+        values[i][0] = 'name{}'.format(i)
+        if i % 7 == 0:
+            values[i][-1] = int(rng.integers(1, 10**6))
+            errneg[i][-1] = errpos[i][-1] = 10
+        if i % 11 == 0:
+            values[i][-1], errneg[i][-1], errpos[i][-1] = 0.0, 1e-9, 1e-9
+    return values, errneg, errpos
+
+
+def run(nrows=20000, ncols=8, seed=0):
+    values, errneg, errpos = synthetic_table(nrows, ncols, seed)
+    tmpdir = tempfile.mkdtemp()
+    results = {}
+    for vectorize in [False, True]:
+        path = os.path.join(tmpdir, 'table_{}.tex'.format(vectorize))
+        # start each run cold so that neither is sped up by the numbers the other formatted
+        export.clear_format_cache()
+        t0 = time.time()
+        export.aastex(path, values, err=[errneg, errpos], vectorize=vectorize)
+        results[vectorize] = time.time() - t0, open(path, 'rb').read()
+        os.remove(path)
+    os.rmdir(tmpdir)
+
+    identical = results[True][1] == results[False][1]
+    print('{} x {} table'.format(nrows, ncols))
+    print('  item by item: {:.3f} s'.format(results[False][0]))
+    print('  column-wise:  {:.3f} s'.format(results[True][0]))
+    print('  identical output: {}'.format(identical))
+    return identical
+
+
+if __name__ == '__main__':
+    args = list(map(int, sys.argv[1:]))
+    if not run(*args):
+        sys.exit(1)
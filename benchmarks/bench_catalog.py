@@ -0,0 +1,216 @@
+"""
+Benchmark suite for the common catalog operations: creating and loading a catalog, set (one item and a list of items),
+addRow, addCol, save, backup, close, comparing catalogs with ==, quickval, and export.aastex. Synthetic catalogs are
+generated at each size requested, and the wall time (best of several runs) and peak memory allocated by Python (from
+tracemalloc, in a separate run so that tracing doesn't slow the timed ones) of each operation are recorded.
+
+Results are written to a JSON file along with the commit and library versions they were measured with, so that runs
+from different commits can be compared with --compare.
+
+Usage: python bench_catalog.py [--sizes 100 1000 ...] [--repeat 3] [--format csv] [--output results.json]
+                               [--compare old_results.json]
+"""
+from __future__ import division, print_function, absolute_import
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import platform
+import tempfile
+import importlib
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# the repository directory is the package, so import it by name from its parent directory
+pkgdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(pkgdir))
+scicatalog = importlib.import_module(os.path.basename(pkgdir))
+SciCatalog = scicatalog.SciCatalog
+export = scicatalog.export
+
+default_sizes = [10**2, 10**3, 10**4, 10**5, 10**6]
+nrefs = 20
+
+
+def synthetic_catalog(ncells, seed=0):
+    """
+    Tables for a catalog of about ncells items, ten columns wide (or fewer, for the smallest sizes), with values
+    spanning many orders of magnitude, about a tenth of the items null, and references drawn from nrefs keys.
+    """
+    rng = np.random.default_rng(seed)
+    ncols = min(10, ncells)
+    nrows = max(ncells // ncols, 1)
+    index = ['star{}'.format(i) for i in range(nrows)]
+    columns = ['col{}'.format(j) for j in range(ncols)]
+    shape = (nrows, ncols)
+
+    values = rng.normal(size=shape) * 10**rng.uniform(-6, 6, size=shape)
+    errpos = np.abs(values) * 10**rng.uniform(-5, -0.3, size=shape)
+    errneg = errpos * rng.uniform(0.5, 2, size=shape)
+    null = rng.random(shape) < 0.1
+    values[null] = errpos[null] = errneg[null] = np.nan
+
+    keys = np.array(['ref{}'.format(i) for i in range(nrefs)], dtype=object)
+    refs = keys[rng.integers(0, nrefs, size=shape)]
+    refs[rng.random(shape) < 0.05] = keys[0] + ',' + keys[1]
+    refs[null] = 'none'
+    refDict = dict((key, 'Author{} et al. ({}), ApJ, {}, {}'.format(i, 1990 + i, 100 + i, i))
+                   for i, key in enumerate(keys))
+
+    DF = lambda data: pd.DataFrame(data, index=index, columns=columns)
+    return dict(values=DF(values), errpos=DF(errpos), errneg=DF(errneg), refs=DF(refs), refDict=refDict,
+                index=index, columns=columns)
+
+
+def measure(func, setup=None, teardown=None, repeat=3):
+    """
+    Time func (called with the result of setup, which isn't timed) repeat times and then run it once more under
+    tracemalloc. teardown is called with the results of setup and func after each run. Returns the best time in
+    seconds and the peak memory allocated during the traced run in bytes.
+    """
+    times = []
+    peak = None
+    for i in range(repeat + 1):
+        state = setup() if setup is not None else None
+        traced = i == repeat
+        if traced:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        result = func(state)
+        elapsed = time.perf_counter() - t0
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            times.append(elapsed)
+        if teardown is not None:
+            teardown(state, result)
+    return dict(seconds=min(times) if times else elapsed, peak_bytes=peak)
+
+
+def bench_size(ncells, tmpdir, repeat=3, format=None, seed=0):
+    """
+    Benchmark every operation on a synthetic catalog of about ncells items, returning a dictionary of the
+    measurements keyed by operation.
+    """
+    data = synthetic_catalog(ncells, seed)
+    index, columns = data['index'], data['columns']
+    rows = [index[i] for i in np.linspace(0, len(index) - 1, min(100, len(index))).astype(int)]
+    row, col = index[len(index) // 2], columns[len(columns) // 2]
+    base = os.path.join(tmpdir, 'base_{}'.format(ncells))
+    results = {}
+    counter = [0]
+    names = itertools.count()
+
+    def fresh_path():
+        counter[0] += 1
+        return os.path.join(tmpdir, 'cat_{}_{}'.format(ncells, counter[0]))
+
+    def create(path):
+        return SciCatalog(path, data['values'], data['errpos'], data['errneg'], data['refs'], data['refDict'], index,
+                          columns, silent=True, format=format)
+
+    def discard(path, cat):
+        cat.close()
+        shutil.rmtree(path)
+
+    create(base).close()
+
+    results['create'] = measure(create, fresh_path, discard, repeat)
+    results['load'] = measure(lambda _: SciCatalog(base, silent=True), None, lambda _, cat: cat.close(), repeat)
+    results['load_readonly'] = measure(lambda _: SciCatalog(base, readOnly=True, silent=True), None, None, repeat)
+
+    # edits are made to a copy of the catalog so that the base stays as generated
+    path = fresh_path()
+    shutil.copytree(base, path)
+    cat = SciCatalog(path, silent=True)
+    results['set_single'] = measure(lambda _: cat.set(row, col, 1.5, 0.1, 0.2, 'ref3'), repeat=repeat)
+    n = len(rows)
+    results['set_list'] = measure(lambda _: cat.set(rows, col, [1.5]*n, [0.1]*n, [0.2]*n, ['ref3']*n), repeat=repeat)
+    results['addRow'] = measure(lambda name: cat.addRow(name), lambda: 'newrow{}'.format(next(names)),
+                                repeat=repeat)
+    results['addCol'] = measure(lambda name: cat.addCol(name), lambda: 'newcol{}'.format(next(names)),
+                                repeat=repeat)
+    results['save'] = measure(lambda _: cat.save(), repeat=repeat)
+    results['backup'] = measure(lambda _: cat.backup(), repeat=repeat)
+    cat.close()
+
+    cat0, cat1 = [SciCatalog(base, readOnly=True, silent=True) for _ in range(2)]
+    results['eq'] = measure(lambda _: cat0 == cat1, repeat=repeat)
+    results['close'] = measure(lambda cat: cat.close(), lambda: SciCatalog(base, silent=True), None, repeat)
+    results['quickval'] = measure(lambda _: scicatalog.quickval(base, row, col), repeat=repeat)
+
+    # the caches of formatted numbers are emptied before each run so that every run formats the table from scratch
+    texpath = os.path.join(tmpdir, 'table.tex')
+    results['aastex'] = measure(lambda _: export.aastex(texpath, cat0.values.values,
+                                                        err=[cat0.errneg.values, cat0.errpos.values],
+                                                        refkeys=cat0.refs.values),
+                                export.clear_format_cache, repeat=repeat)
+    return results
+
+
+def environment():
+    """
+    The commit, library versions, and machine the benchmarks are run with.
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=pkgdir,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(commit=commit, time=time.strftime('%Y-%m-%dT%H:%M:%S'), python=platform.python_version(),
+                numpy=np.__version__, pandas=pd.__version__, platform=platform.platform(),
+                processor=platform.processor())
+
+
+def run(sizes=default_sizes, repeat=3, format=None, output='bench_catalog.json', seed=0):
+    tmpdir = tempfile.mkdtemp()
+    results = dict(environment=environment(), repeat=repeat, format=format, results=[])
+    try:
+        for ncells in sizes:
+            print('{} cells'.format(ncells))
+            for op, m in bench_size(ncells, tmpdir, repeat, format, seed).items():
+                print('  {:14s} {:10.4f} s {:10.2f} MB'.format(op, m['seconds'], m['peak_bytes']/2.**20))
+                results['results'].append(dict(cells=ncells, op=op, **m))
+    finally:
+        shutil.rmtree(tmpdir)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('Results written to {}.'.format(output))
+    return results
+
+
+def compare(old, new):
+    """
+    Print the ratio of the new to the old time and peak memory of each operation measured in both results files.
+    """
+    load = lambda path: json.load(open(path))
+    old, new = load(old), load(new)
+    oldResults = dict(((r['cells'], r['op']), r) for r in old['results'])
+    print('{} -> {}'.format(old['environment']['commit'], new['environment']['commit']))
+    print('{:>8s} {:14s} {:>10s} {:>10s}'.format('cells', 'op', 'time', 'memory'))
+    for r in new['results']:
+        o = oldResults.get((r['cells'], r['op']))
+        if o is None:
+            continue
+        ratio = lambda key: r[key]/o[key] if o[key] else float('nan')
+        print('{:8d} {:14s} {:9.2f}x {:9.2f}x'.format(r['cells'], r['op'], ratio('seconds'), ratio('peak_bytes')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help='number of cells in each catalog')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of each operation (the best is kept)')
+    parser.add_argument('--format', default=None, help='storage format of the catalogs (csv, npz, or parquet)')
+    parser.add_argument('--output', default='bench_catalog.json', help='file to write the results to')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', default=None, help='earlier results file to compare the new results with')
+    args = parser.parse_args()
+    run(args.sizes, args.repeat, args.format, args.output, args.seed)
+    if args.compare is not None:
+        compare(args.compare, args.output)
@@ -0,0 +1,179 @@
+"""
+An in-process cache of catalogs opened in read only mode, for scripts and servers that read the same few catalogs
+over and over. A cached catalog is reused for as long as none of its files have changed on the disk (judged by their
+modification times and sizes), and the least recently used catalogs are dropped once the cache holds too many or they
+take up too much memory.
+
+Catalogs from the cache are shared, so treat them as strictly read only.
+
+Example
+-------
+>>> from scicatalog import cache
+>>> cat = cache.load('stars')
+>>> cache.stats()
+{'hits': 0, 'misses': 1, 'evictions': 0, 'invalidations': 0, 'items': 1, 'bytes': 10624}
+"""
+from __future__ import division, print_function, absolute_import
+import os
+import threading
+from collections import OrderedDict
+
+
+class CatalogCache:
+    """
+    A least-recently-used cache of read only catalogs.
+
+    Parameters
+    ----------
+    maxItems : int
+        Most catalogs to hold.
+    maxBytes : int
+        Most memory (in bytes, as reported by pandas for the tables) the catalogs may take up. None means no limit.
+    """
+    def __init__(self, maxItems=32, maxBytes=2**30):
+        self.maxItems = maxItems
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = dict(hits=0, misses=0, evictions=0, invalidations=0)
+
+    def load(self, path, index=None, columns=None, lowMemory=False, float32=False):
+        """
+        Return a read only SciCatalog for the catalog at path, from the cache if it is there and up to date. index
+        and columns restrict the rows and columns loaded and lowMemory and float32 choose a compact form for the
+        tables, as for SciCatalog.
+        """
+        from .scicatalog import SciCatalog
+
+        key = self._key(path, index, columns, lowMemory, float32)
+        signature = fileSignature(path)
+        with self._lock:
+            cat = self._get(key, signature)
+            if cat is not None:
+                self._stats['hits'] += 1
+                return cat
+            self._stats['misses'] += 1
+
+        cat = SciCatalog(path, readOnly=True, silent=True, index=index, columns=columns, lowMemory=lowMemory,
+                         float32=float32)
+        # don't cache a catalog whose files changed while it was loading
+        if fileSignature(path) != signature:
+            return cat
+        nbytes = memoryUsage(cat)
+
+        with self._lock:
+            if self.maxBytes is None or nbytes <= self.maxBytes:
+                self._entries[key] = (cat, signature, nbytes)
+                self._entries.move_to_end(key)
+                self._evict()
+        return cat
+
+    def peek(self, path):
+        """
+        Return the full catalog at path if it is in the cache and up to date, otherwise None (without loading it).
+        """
+        with self._lock:
+            cat = self._get(self._key(path, None, None, False, False), fileSignature(path))
+            if cat is not None:
+                self._stats['hits'] += 1
+            return cat
+
+    def stats(self):
+        """
+        Return a dictionary of the number of cache hits, misses, evictions (to make room), and invalidations (because
+        the files changed) so far, along with the number of catalogs held and the memory they take up.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['items'] = len(self._entries)
+            stats['bytes'] = sum(nbytes for _, _, nbytes in self._entries.values())
+        return stats
+
+    def clear(self):
+        """
+        Empty the cache and reset the statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            for key in self._stats:
+                self._stats[key] = 0
+
+    def _key(self, path, index, columns, lowMemory, float32):
+        return (os.path.abspath(path), None if index is None else tuple(index),
+                None if columns is None else tuple(columns), lowMemory, float32)
+
+    def _get(self, key, signature):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        cat, oldSignature, _ = entry
+        if oldSignature != signature:
+            del self._entries[key]
+            self._stats['invalidations'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return cat
+
+    def _evict(self):
+        total = sum(nbytes for _, _, nbytes in self._entries.values())
+        while self._entries and (len(self._entries) > self.maxItems or
+                                 (self.maxBytes is not None and total > self.maxBytes)):
+            _, (_, _, nbytes) = self._entries.popitem(last=False)
+            total -= nbytes
+            self._stats['evictions'] += 1
+
+
+def fileSignature(path):
+    """
+    The names, modification times, and sizes of the files in the catalog directory at path that hold its data (the
+    tables, reference dictionary, manifest, and journal), which change whenever the catalog does.
+    """
+    signature = []
+    for entry in os.scandir(path):
+        if entry.is_file() and not entry.name.endswith(('.lock', '.idx', '.tmp')):
+            stat = entry.stat()
+            signature.append((entry.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(signature))
+
+
+def memoryUsage(cat):
+    """
+    Bytes of memory taken up by the tables of a catalog.
+    """
+    return int(cat.memoryUsage().sum())
+
+
+catalogs = CatalogCache()
+
+
+def load(path, index=None, columns=None, lowMemory=False, float32=False):
+    """
+    Return a read only SciCatalog for the catalog at path from the module's cache. See CatalogCache.load.
+    """
+    return catalogs.load(path, index, columns, lowMemory, float32)
+
+
+def stats():
+    """
+    Statistics of the module's cache. See CatalogCache.stats.
+    """
+    return catalogs.stats()
+
+
+def clear():
+    """
+    Empty the module's cache.
+    """
+    catalogs.clear()
+
+
+def configure(maxItems=None, maxBytes=None):
+    """
+    Change the limits of the module's cache, evicting catalogs if need be.
+    """
+    with catalogs._lock:
+        if maxItems is not None:
+            catalogs.maxItems = maxItems
+        if maxBytes is not None:
+            catalogs.maxBytes = maxBytes
+        catalogs._evict()
@@ -1,11 +1,20 @@
 from __future__ import division, print_function, absolute_import
+import os
+import time
+import numpy as np
+from warnings import warn
+from concurrent.futures import ProcessPoolExecutor
 from numpy import isfinite
 from string import ascii_lowercase
 from collections import OrderedDict
-from math import ceil, floor, log10
+from functools import lru_cache
+from math import ceil, floor, log10, copysign, isfinite as _isfinite
+
+# number of formatted numbers remembered by each of _tex_fmt and _fmt_sig (see set_format_cache_size)
+format_cache_size = 2**16
 
 def aastex(filename, values, err=None, notes=None, refkeys=None, compactrefs=False, sigfigs_err=2, fmts=None,
-           force_fmt=False, hdr=None, hdrnotes=None, datatags=True):
+           force_fmt=False, hdr=None, hdrnotes=None, datatags=True, vectorize=True):
     """
     Format the arrays for inclusion as the body of an AASTEX deluxetable using \input{filename}. The user should
     create the table header separately -- this just produces the body.
@@ -37,42 +46,222 @@ def aastex(filename, values, err=None, notes=None, refkeys=None, compactrefs=Fal
     hdrnotes : list
         A list of the notes that are associated with the header. This will increment the label for any further notes
         associated with table elements and include these notes at the start of the full list of notes.
+    vectorize : True|False
+        If True, format the numbers a column at a time with numpy (much faster for long tables). The output is
+        identical either way.
 
 
     Returns
     -------
     None, writes a file to filename.
     """
-    Nrows = len(values)
     Ncols = len(values[0])
 
-    if err is None:
-        errneg = errpos = [[None]*Ncols]*Nrows
+    # determine which columns will have references
+    hasrefs = None
+    if refkeys is not None:
+        refsbycol = list(zip(*refkeys))
+        hasrefs = [not all(map(_isnull, refcol)) for refcol in refsbycol]
+
+    chunk = dict(values=values, err=err, notes=notes, refkeys=refkeys)
+    lines = _aastex_lines([chunk], Ncols, hasrefs, compactrefs, sigfigs_err, fmts, force_fmt, hdr, hdrnotes,
+                          datatags, vectorize)
+
+    # write to file
+    _write_lines(filename, list(lines))
+
+
+def aastex_stream(filename, chunks, ncols, refcols=None, compactrefs=False, sigfigs_err=2, fmts=None,
+                  force_fmt=False, hdr=None, hdrnotes=None, datatags=True, vectorize=True):
+    """
+    Like aastex, but takes the table a chunk of rows at a time and writes each row to the file as soon as it is
+    formatted, so that only one chunk need be in memory at once. The note and reference legends are written at the
+    end. Because the chunks are consumed as they come, an error in a later chunk leaves a partially written file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of text file to output. File extension will NOT be appended.
+    chunks : iterable of dicts
+        Each dict has a 'values' 2D array-like of one or more rows of the table and, optionally, 'err', 'notes', and
+        'refkeys' for those rows, formatted as the equivalent arguments to aastex. A generator of single-row chunks
+        works too. See scicatalog.iterchunks for reading chunks straight from a catalog's table files.
+    ncols : int
+        Number of columns in the table.
+    refcols : list
+        Indices of the columns that have references. Because the whole table is not available up front, this replaces
+        the check aastex makes for columns without any references. Every chunk must include refkeys if this is
+        given.
+
+    Other parameters are as for aastex.
+
+    Returns
+    -------
+    None, writes a file to filename.
+    """
+    hasrefs = None
+    if refcols is not None:
+        hasrefs = [j in refcols for j in range(ncols)]
+    lines = _aastex_lines(chunks, ncols, hasrefs, compactrefs, sigfigs_err, fmts, force_fmt, hdr, hdrnotes,
+                          datatags, vectorize)
+    _write_lines(filename, lines)
+
+
+def aastex_catalog(filename, catalog, columns=None, rows=None, labels=True, **kws):
+    """
+    Like aastex, but takes the values, errors, and reference keys straight from a catalog.
+
+    Parameters
+    ----------
+    filename : str
+        Name of text file to output. File extension will NOT be appended.
+    catalog : SciCatalog, CatalogView, or str
+        The catalog, a view of one, or the path of a catalog to open read only (reading only the columns and rows
+        needed).
+    columns, rows : list
+        Columns and rows of the catalog to put in the table. Default is all of them.
+    labels : True|False
+        If True, the row labels are included as the first column of the table (with no errors or references).
+
+    Other keywords are passed to aastex.
+
+    Returns
+    -------
+    None, writes a file to filename.
+    """
+    tables = catalog_tables(catalog, columns, rows, labels)
+    tables.update(kws)
+    aastex(filename, **tables)
+
+
+def aastex_batch(jobs, processes=None):
+    """
+    Render many tables at once in a pool of processes.
+
+    Parameters
+    ----------
+    jobs : list
+        Each job is a tuple of (catalog, columns, options, filename) or a dict with those keys (and optionally
+        'rows'), where catalog, columns, and rows are as for aastex_catalog and options is a dict of keywords for
+        aastex_catalog (or None). Catalogs given as objects have their tables pulled out in this process and handed to
+        the pool as arrays. Catalogs given as paths are read by the worker processes, which is quicker.
+    processes : int
+        Number of worker processes. Default is the number of CPUs. With 1, the jobs are run one after another in
+        this process.
+
+    Returns
+    -------
+    results : list
+        A dict for each job, in order, giving the filename, the seconds spent pulling the tables out of the catalog in
+        this process (prepare_seconds) and reading and rendering the table in the worker (seconds), the pid of the
+        worker, and the error that stopped the job as a string (or None). A warning lists any jobs that failed.
+    """
+    payloads, prepare_times = [], []
+    for job in jobs:
+        t0 = time.time()
+        payloads.append(_batch_payload(job))
+        prepare_times.append(time.time() - t0)
+
+    if processes == 1:
+        results = list(map(_render_job, payloads))
     else:
-        if hasattr(err[0][0], '__iter__'):
-            assert len(err) == 2
-            errneg, errpos = err
-        else:
-            errneg = errpos = err
-
-    # check that dimensions all agree
-    arys = [a for a in [values, errneg, errpos, notes, refkeys] if a is not None]
-    equal_lens = lambda l0, a: all([l0 == l for l in map(len, a)])
-    if not equal_lens(Nrows, arys):
-        raise ValueError('All input must have the same number of rows.')
-    for ary in arys:
-        if not equal_lens(Ncols, ary):
-            raise ValueError('All rows of the input must be the same length.')
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_render_job, payloads))
+
+    for result, prepare_time in zip(results, prepare_times):
+        result['prepare_seconds'] = prepare_time
+    failed = [r for r in results if r['error'] is not None]
+    if failed:
+        warn('{} of {} tables failed to render:\n'.format(len(failed), len(results))
+             + '\n'.join('{}: {}'.format(r['filename'], r['error']) for r in failed))
+    return results
+
+
+def catalog_tables(catalog, columns=None, rows=None, labels=True):
+    """
+    Pull the values, errors, and reference keys of a catalog out as 2D arrays ready to be passed to aastex (or to
+    aastex_stream as a chunk) as the values, err, and refkeys keywords. Arguments are as for aastex_catalog.
+
+    Returns
+    -------
+    A dictionary with 'values', 'err', and 'refkeys' keys.
+    """
+    if isinstance(catalog, str):
+        from .scicatalog import SciCatalog
+        if not os.path.isdir(catalog):
+            raise IOError('There is no catalog at {}.'.format(catalog))
+        catalog = SciCatalog(catalog, readOnly=True, silent=True, index=rows, columns=columns)
+    elif columns is not None or rows is not None:
+        catalog = catalog.select(rows, columns)
+
+    values, errneg, errpos, refkeys = [tbl.to_numpy(dtype=object) for tbl in
+                                       [catalog.values, catalog.errneg, catalog.errpos, catalog.refs]]
+    if labels:
+        n = len(values)
+        lbls = np.array([str(lbl) for lbl in catalog.values.index], dtype=object).reshape(n, 1)
+        nulls = np.full((n, 1), None, dtype=object)
+        values, errneg, errpos = [np.hstack([first, ary]) for first, ary in
+                                  [(lbls, values), (nulls, errneg), (nulls, errpos)]]
+        refkeys = np.hstack([np.full((n, 1), 'none', dtype=object), refkeys])
+    return dict(values=values, err=[errneg, errpos], refkeys=refkeys)
+
+
+def _batch_payload(job):
+    """
+    Turn a job for aastex_batch into the dict handed to a worker, pulling the tables out of catalog objects.
+    """
+    if isinstance(job, dict):
+        catalog, columns, options, filename = job['catalog'], job.get('columns'), job.get('options'), job['filename']
+        rows = job.get('rows')
+    else:
+        catalog, columns, options, filename = job
+        rows = None
+    options = dict(options or {})
+    columns, rows = options.pop('columns', columns), options.pop('rows', rows)
+    labels = options.pop('labels', True)
+    if not isinstance(catalog, str):
+        catalog = catalog_tables(catalog, columns, rows, labels)
+    return dict(catalog=catalog, columns=columns, rows=rows, labels=labels, options=options, filename=filename)
+
+
+def _render_job(payload):
+    """
+    Render the table for one job of aastex_batch, timing it and catching any error.
+    """
+    t0 = time.time()
+    error = None
+    try:
+        tables = payload['catalog']
+        if isinstance(tables, str):
+            tables = catalog_tables(tables, payload['columns'], payload['rows'], payload['labels'])
+        tables.update(payload['options'])
+        aastex(payload['filename'], **tables)
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+    return dict(filename=payload['filename'], seconds=time.time() - t0, pid=os.getpid(), error=error)
+
+
+def _write_lines(filename, lines):
+    """
+    Write the lines to the file one at a time, separated by newlines.
+    """
+    with open(filename, 'w') as f:
+        for i, line in enumerate(lines):
+            if i > 0:
+                f.write('\n')
+            f.write(line)
+
+
+def _aastex_lines(chunks, Ncols, hasrefs, compactrefs, sigfigs_err, fmts, force_fmt, hdr, hdrnotes, datatags,
+                  vectorize):
+    """
+    Generate the lines of an AASTEX table body from chunks of rows. See aastex and aastex_stream.
+    """
     if fmts is None:
         fmts = ['']*Ncols
     else:
         assert len(fmts) == Ncols
 
-    # determine which columns will have references
-    if refkeys is not None:
-        refsbycol = list(zip(*refkeys))
-        hasrefs = [not all(map(_isnull, refcol)) for refcol in refsbycol]
-
     # prep for possible notes
     alphabet = iter(ascii_lowercase)
     notedict = OrderedDict()
@@ -88,73 +277,105 @@ def aastex(filename, values, err=None, notes=None, refkeys=None, compactrefs=Fal
             addnote(hdrnote)
 
     # go through writing out the table line by line
-    lines = [] if hdr is None else [hdr]
+    if hdr is not None:
+        yield hdr
     if datatags:
-        lines.append('\\startdata')
+        yield '\\startdata'
     reflist = []
-    for i in range(Nrows):
-        items = []
-        for j in range(Ncols):
-            # make entry
-            value, errn, errp = values[i][j], errneg[i][j], errpos[i][j]
-            if isinstance(value, (str, bytes)):
-                item = '\\nodata' if _isnull(value) else value
+    for chunk in chunks:
+        values, err = chunk['values'], chunk.get('err')
+        notes, refkeys = chunk.get('notes'), chunk.get('refkeys')
+        Nrows = len(values)
+        if Nrows == 0:
+            continue
+
+        if err is None:
+            errneg = errpos = [[None]*Ncols]*Nrows
+        else:
+            if hasattr(err[0][0], '__iter__'):
+                assert len(err) == 2
+                errneg, errpos = err
             else:
-                item = _tex_fmt(value, errn, errp, sigfigs_err, fmts[j], force_fmt)
-
-            # add any note
-            if notes is not None:
-                note = notes[i][j]
-                if not _isnull(note) and len(note.strip()) > 0:
-                    mark = addnote(note)
-                    item += '\\tablenotemark{{{}}}'.format(mark)
-            items.append(item)
-
-            # add references
-            if refkeys is not None and hasrefs[j]:
-                entry = refkeys[i][j]
-                if _isnull(entry):
-                    items.append('')
+                errneg = errpos = err
+
+        # check that dimensions all agree
+        arys = [a for a in [values, errneg, errpos, notes, refkeys] if a is not None]
+        equal_lens = lambda l0, a: all([l0 == l for l in map(len, a)])
+        if not equal_lens(Nrows, arys):
+            raise ValueError('All input must have the same number of rows.')
+        for ary in arys:
+            if not equal_lens(Ncols, ary):
+                raise ValueError('All rows of the input must be the same length.')
+
+        # format the numbers a column at a time
+        if vectorize:
+            formatted = [_tex_fmt_column([row[j] for row in values], [row[j] for row in errneg],
+                                         [row[j] for row in errpos], sigfigs_err, fmts[j], force_fmt)
+                         for j in range(Ncols)]
+
+        for i in range(Nrows):
+            items = []
+            for j in range(Ncols):
+                # make entry
+                value, errn, errp = values[i][j], errneg[i][j], errpos[i][j]
+                if isinstance(value, (str, bytes)):
+                    item = '\\nodata' if _isnull(value) else value
+                elif vectorize:
+                    item = formatted[j][i]
+                    if isinstance(item, Exception):
+                        raise item
                 else:
-                    refs = entry.split(',')
-                    if compactrefs:
-                        if not _isnull(entry):
-                            klist = []
-                            for ref in refs:
-                                try:
-                                    k = reflist.index(ref) + 1
-                                except ValueError:
-                                    reflist.append(ref)
-                                    k = len(reflist)
-                                klist.append(k)
-                            klist = list(map(str, klist))
-                            items.append(','.join(klist))
+                    item = _tex_fmt(value, errn, errp, sigfigs_err, fmts[j], force_fmt)
+
+                # add any note
+                if notes is not None:
+                    note = notes[i][j]
+                    if not _isnull(note) and len(note.strip()) > 0:
+                        mark = addnote(note)
+                        item += '\\tablenotemark{{{}}}'.format(mark)
+                items.append(item)
+
+                # add references
+                if hasrefs is not None and hasrefs[j]:
+                    entry = refkeys[i][j]
+                    if _isnull(entry):
+                        items.append('')
                     else:
-                        refs = ['\\citet{{{}}}'.format(r) for r in refs]
-                        items.append(','.join(refs))
-
-        lines.append(' & '.join(items) + '\\\\')
+                        refs = entry.split(',')
+                        if compactrefs:
+                            if not _isnull(entry):
+                                klist = []
+                                for ref in refs:
+                                    try:
+                                        k = reflist.index(ref) + 1
+                                    except ValueError:
+                                        reflist.append(ref)
+                                        k = len(reflist)
+                                    klist.append(k)
+                                klist = list(map(str, klist))
+                                items.append(','.join(klist))
+                        else:
+                            refs = ['\\citet{{{}}}'.format(r) for r in refs]
+                            items.append(','.join(refs))
+
+            yield ' & '.join(items) + '\\\\'
     if datatags:
-        lines.append('\\enddata')
-    lines.append('')
+        yield '\\enddata'
+    yield ''
 
     # add note legend
     for note, mark in list(notedict.items()):
-        lines.append('\\tablenotetext{{{}}}{{{}}}'.format(mark, note))
-    lines.append('')
+        yield '\\tablenotetext{{{}}}{{{}}}'.format(mark, note)
+    yield ''
 
     # add reference legend
-    if refkeys is not None and compactrefs:
+    if hasrefs is not None and compactrefs:
         entries = []
         for i, ref in enumerate(reflist):
             entries.append('({}) \\citealt{{{}}}'.format(i+1, ref))
         reflgnd = '\\tablerefs{' +  '; '.join(entries) + '}'
-        lines.append(reflgnd)
-        lines.append('')
-
-    # write to file
-    with open(filename, 'w') as f:
-        f.write('\n'.join(lines))
+        yield reflgnd
+        yield ''
 
 
 def _err_sigdig(err):
@@ -166,8 +387,72 @@ def _err_sigdig(err):
         raise ValueError("Negative error not allowed.")
 
 
+def format_cache_stats():
+    """
+    Return a dictionary of the hits, misses, current size, and maximum size of the caches of formatted numbers (summed
+    over the _tex_fmt and _fmt_sig caches) and the fraction of lookups that were hits.
+    """
+    infos = [_tex_fmt_cached.cache_info(), _fmt_sig_cached.cache_info()]
+    stats = dict(hits=sum(i.hits for i in infos), misses=sum(i.misses for i in infos),
+                 size=sum(i.currsize for i in infos), maxsize=sum(i.maxsize for i in infos))
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits']/lookups if lookups else 0.
+    return stats
+
+
+def clear_format_cache():
+    """
+    Empty the caches of formatted numbers and reset their statistics.
+    """
+    _tex_fmt_cached.cache_clear()
+    _fmt_sig_cached.cache_clear()
+
+
+def set_format_cache_size(maxsize):
+    """
+    Change the number of formatted numbers each cache holds, emptying them. 0 turns caching off.
+    """
+    global format_cache_size, _tex_fmt_cached, _fmt_sig_cached
+    format_cache_size = maxsize
+    _tex_fmt_cached = lru_cache(maxsize, typed=True)(_tex_fmt_keyed)
+    _fmt_sig_cached = lru_cache(maxsize, typed=True)(_fmt_sig_keyed)
+
+
+# marks the cache keys standing in for nan and -0.0 (see _cache_key)
+_special_key = object()
+
+
+def _cache_key(x):
+    """
+    Stand-in for x in the keys of the format caches. nan never equals itself and -0.0 equals 0.0 (but is printed with
+    its sign), so both are replaced by a tuple of a marker, their type, and their string form that _from_cache_key
+    turns back into the same number.
+    """
+    if isinstance(x, (float, np.floating)) and (x != x or (x == 0 and copysign(1., x) < 0)):
+        return (_special_key, type(x), str(x))
+    return x
+
+
+def _from_cache_key(x):
+    if type(x) is tuple and len(x) == 3 and x[0] is _special_key:
+        return x[1](x[2])
+    return x
+
+
 def _tex_fmt(value, errneg, errpos, sigfigs_err, fmt, forcefmt):
-    """Format a value for tex display, suing the errors to define the precision unless fmt is specified."""
+    """
+    Format a value for tex display, suing the errors to define the precision unless fmt is specified. Results are
+    cached, since tables tend to repeat the same numbers (placeholder errors, limits, rounded values).
+    """
+    return _tex_fmt_cached(_cache_key(value), _cache_key(errneg), _cache_key(errpos), sigfigs_err, fmt, forcefmt)
+
+
+def _tex_fmt_keyed(value, errneg, errpos, sigfigs_err, fmt, forcefmt):
+    return _tex_fmt_uncached(_from_cache_key(value), _from_cache_key(errneg), _from_cache_key(errpos), sigfigs_err,
+                             fmt, forcefmt)
+
+
+def _tex_fmt_uncached(value, errneg, errpos, sigfigs_err, fmt, forcefmt):
     if _isnull(value):
         if _isnull(errpos) and _isnull(errneg):
             return '\\nodata'
@@ -245,7 +530,125 @@ def _tex_fmt(value, errneg, errpos, sigfigs_err, fmt, forcefmt):
                 return '${}_{{-{}}}^{{+{}}}$'.format(vstr, enstr, epstr)
 
 
+_real_types = {float, int, np.float64, np.int64}
+
+
+def _as_floats(items):
+    """
+    Return a float array of the items and a boolean array flagging which items are ordinary real numbers (any
+    other items are nan in the float array).
+    """
+    if set(map(type, items)) <= _real_types:
+        return np.array(items, dtype=float), np.ones(len(items), dtype=bool)
+    isnum = np.array([type(x) in _real_types for x in items], dtype=bool)
+    return np.array([x if num else np.nan for x, num in zip(items, isnum)], dtype=float), isnum
+
+
+def _tex_fmt_column(values, errneg, errpos, sigfigs_err, fmt, forcefmt):
+    """
+    Format a column of values for tex display, giving exactly the same results as applying _tex_fmt to each item.
+
+    The precision and notation of items with finite values and errors are worked out for the whole column at once
+    with numpy. Items that are strings, null, limits, or otherwise unusual are passed to _tex_fmt one by one, as are
+    the (rare) items where floating point error could make the numpy result differ from _tex_fmt.
+    """
+    n = len(values)
+    result = [None]*n
+
+    v, vnum = _as_floats(values)
+    en, ennum = _as_floats(errneg)
+    ep, epnum = _as_floats(errpos)
+    isreal = vnum & np.isfinite(v)
+    with np.errstate(invalid='ignore'):
+        haserr = ennum & epnum & np.isfinite(en) & np.isfinite(ep) & (en >= 0) & (ep >= 0)
+    noerr = (ennum & ~np.isfinite(en)) | np.equal(np.array(errneg, dtype=object), None)
+
+    # values without errors printed with a fixed point format
+    if fmt is not None and 'f' in fmt:
+        for i in np.flatnonzero(isreal & noerr).tolist():
+            result[i] = fmt.format(values[i])
+
+    # values with errors, using the errors to set the precision
+    fast = np.flatnonzero(isreal & haserr) if not forcefmt else np.array([], dtype=int)
+    if len(fast) > 0:
+        v, en, ep = v[fast], en[fast], ep[fast]
+        fast = fast.tolist()
+
+        # place of the most significant digit of the errors, deferring to math.log10 where rounding could matter
+        def err_sigdig(err):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lg = np.log10(err)
+                close = (err > 0) & (np.abs(lg - np.round(lg)) < 1e-9)
+            sigdig = np.where(err > 0, np.floor(lg), 0).astype(int)
+            for k in np.flatnonzero(close):
+                sigdig[k] = _err_sigdig(err[k])
+            return sigdig
+        sdp, sdn = err_sigdig(ep), err_sigdig(en)
+        minsigdig = np.where(np.abs(sdp - sdn) >= sigfigs_err, np.minimum(sdp, sdn),
+                             np.maximum(sdp, sdn) - sigfigs_err + 1)
+
+        # exponent of the value as '{:e}' would print it, deferring to the string where rounding could matter
+        absv = np.abs(v)
+        lg = np.log10(np.where(absv > 0, absv, 1.))
+        exp = np.floor(lg).astype(int)
+        mantissa = absv / 10.**exp
+        unsure = (absv > 0) & ((mantissa < 1.000001) | (mantissa > 9.999994) | (np.abs(lg - np.round(lg)) < 1e-9))
+        for k in np.flatnonzero(unsure):
+            exp[k] = int(_split_numstr('{:e}'.format(values[fast[k]]))[2])
+
+        # _max_sigdig reads the place of the most significant digit from the '{:e}' string, which it takes
+        # literally when the exponent is zero
+        maxsigdig = exp.copy()
+        zeroexp = exp == 0
+        maxsigdig[zeroexp & np.signbit(v)] = 1
+        maxsigdig[zeroexp & (v == 0) & ~np.signbit(v)] = -7
+
+        sigfigs = maxsigdig - minsigdig + 1
+        precision = np.where(minsigdig < 0, -minsigdig, 0).tolist()
+        lenexpstr = np.where(np.abs(exp) >= 100, 3, 2) + (exp < 0)
+        lenexp = sigfigs + 4 + 0.5*lenexpstr
+
+        # decimal notation where it is shorter
+        decstrs = ['%.*f' % (p, values[i]) for p, i in zip(precision, fast)]
+        usedec = np.fromiter(map(len, decstrs), dtype=int, count=len(decstrs)) < lenexp
+        for k in np.flatnonzero(usedec).tolist():
+            i, p = fast[k], precision[k]
+            enstr, epstr = '%.*f' % (p, errneg[i]), '%.*f' % (p, errpos[i])
+            if enstr == epstr:
+                result[i] = '$ %s \\pm %s $' % (decstrs[k], enstr)
+            else:
+                result[i] = '$%s_{-%s}^{+%s}$' % (decstrs[k], enstr, epstr)
+
+        # scientific notation otherwise
+        for k in np.flatnonzero(~usedec & (sigfigs >= 1)).tolist():
+            i, e, p = fast[k], int(exp[k]), int(sigfigs[k]) - 1
+            vstr, enstr, epstr = ['%.*f' % (p, x*10**-e) for x in [values[i], errneg[i], errpos[i]]]
+            expstr = '%03d' % e if e < 0 else '%02d' % e
+            if enstr == epstr:
+                result[i] = '$%s \\pm %s \\times10^{%s}$' % (vstr, enstr, expstr)
+            else:
+                result[i] = '$%s_{-%s}^{+%s}\\times10^{%s}$' % (vstr, enstr, epstr, expstr)
+
+    # everything else the slow way, holding on to any errors to be raised when aastex reaches that item
+    for i in range(n):
+        if result[i] is None and not isinstance(values[i], (str, bytes)):
+            try:
+                result[i] = _tex_fmt(values[i], errneg[i], errpos[i], sigfigs_err, fmt, forcefmt)
+            except Exception as e:
+                result[i] = e
+
+    return result
+
+
 def _fmt_sig(value, sigfigs_or_fmt):
+    return _fmt_sig_cached(_cache_key(value), sigfigs_or_fmt)
+
+
+def _fmt_sig_keyed(value, sigfigs_or_fmt):
+    return _fmt_sig_uncached(_from_cache_key(value), sigfigs_or_fmt)
+
+
+def _fmt_sig_uncached(value, sigfigs_or_fmt):
     if value == 0:
         return '0'
 
@@ -324,9 +727,20 @@ def _max_sigdig(numstr):
 
 
 def _isnull(value):
+    # fast paths for the common cases, avoiding numpy.isfinite on python scalars
+    if value is None:
+        return True
+    if isinstance(value, float):
+        return not _isfinite(value)
+    if type(value) is int:
+        return False
     if isinstance(value, (str, bytes)):
      return value.lower() == 'none'
     if (value != 0) and not value:
      return True
     else:
-     return not isfinite(value)
\ No newline at end of file
+     return not isfinite(value)
+
+
+_tex_fmt_cached = _fmt_sig_cached = None
+set_format_cache_size(format_cache_size)
@@ -0,0 +1,218 @@
+"""
+Advisory locks for coordinating the processes that read and edit a catalog. Locks are taken with fcntl.flock where it
+is available, so they are released by the operating system when the process holding them exits, however it exits.
+Elsewhere, an exclusive lock is a file created atomically, and one left behind by a process that died is recognized
+from the process ID, host, and lease recorded in it.
+"""
+from __future__ import division, print_function, absolute_import
+import os
+import time
+import json
+import errno
+import socket
+import getpass
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class LockTimeout(Exception):
+    """
+    Raised when a lock could not be acquired within the timeout.
+    """
+    def __init__(self, message, holder=None):
+        Exception.__init__(self, message)
+        self.holder = holder
+
+
+class FileLock:
+    """
+    A shared (reader) or exclusive (writer) lock on the file at path.
+
+    Parameters
+    ----------
+    path : str
+        Path of the lock file. It is created if need be and left in place when the lock is released.
+    lease : float
+        Number of seconds after which an exclusive lock that hasn't been renewed may be considered abandoned. Only
+        used where fcntl isn't available. Default is to never expire.
+
+    Example
+    -------
+    >>> with FileLock('cat/catalog.lock').acquire(timeout=10):
+    ...     pass
+    """
+    poll = 0.05
+
+    def __init__(self, path, lease=None):
+        self.path = path
+        self.lease = lease
+        self.shared = None
+        self._file = None
+
+    @property
+    def held(self):
+        return self.shared is not None
+
+    def acquire(self, shared=False, timeout=None):
+        """
+        Acquire the lock, waiting up to timeout seconds for other processes to release it (forever if timeout is None,
+        not at all if it is 0). Raises LockTimeout if the lock can't be had in that time. Returns the lock, so that it
+        can be used as a context manager.
+        """
+        if self.held:
+            raise RuntimeError('The lock on {} is already held.'.format(self.path))
+        start = time.time()
+        while not self._tryAcquire(shared):
+            if timeout is not None and time.time() - start >= timeout:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                holder = self.holder()
+                raise LockTimeout('Timed out waiting for the lock on {}{}.'
+                                  ''.format(self.path, '' if holder is None else ', held by ' + describe(holder)),
+                                  holder)
+            time.sleep(self.poll)
+        self.shared = shared
+        if not shared:
+            self._writeInfo()
+        return self
+
+    def release(self):
+        """
+        Release the lock if it is held.
+        """
+        if not self.held:
+            return
+        if fcntl is not None:
+            # empty the holder info so nobody mistakes it for a live lock, then let go
+            if not self.shared:
+                self._file.seek(0)
+                self._file.truncate()
+                self._file.flush()
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        elif not self.shared:
+            os.remove(self.path)
+        self.shared = None
+
+    def renew(self):
+        """
+        Extend the lease of a held exclusive lock.
+        """
+        if self.held and not self.shared:
+            self._writeInfo()
+
+    def holder(self):
+        """
+        Return a dictionary describing the process holding the exclusive lock (user, host, pid, acquired, and expires),
+        or None if that isn't known.
+        """
+        try:
+            with open(self.path) as f:
+                content = f.read()
+        except (IOError, OSError):
+            return None
+        try:
+            return json.loads(content)
+        except ValueError:
+            # anything else is taken to be the name of the user
+            return dict(user=content.strip()) if content.strip() else None
+
+    def __enter__(self):
+        if not self.held:
+            self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def __del__(self):
+        try:
+            self.release()
+        except Exception:
+            pass
+
+    def _tryAcquire(self, shared):
+        if fcntl is not None:
+            if self._file is None:
+                self._file = open(self.path, 'a+')
+            mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            try:
+                fcntl.flock(self._file.fileno(), mode | fcntl.LOCK_NB)
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                    raise
+                return False
+            return True
+
+        # without fcntl, readers don't lock and writers create the lock file exclusively
+        if shared:
+            return True
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            if isStale(self.holder()):
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+            return False
+        os.close(fd)
+        return True
+
+    def _writeInfo(self):
+        now = time.time()
+        info = dict(user=getpass.getuser(), host=socket.gethostname(), pid=os.getpid(), acquired=now,
+                    expires=None if self.lease is None else now + self.lease)
+        if fcntl is not None:
+            self._file.seek(0)
+            self._file.truncate()
+            json.dump(info, self._file)
+            self._file.flush()
+        else:
+            with open(self.path, 'w') as f:
+                json.dump(info, f)
+
+
+def isStale(holder):
+    """
+    Whether the holder of a lock (as returned by FileLock.holder) is known to be gone, either because its lease has
+    expired or because it was a process on this host that is no longer running.
+    """
+    if holder is None:
+        return False
+    if holder.get('expires') is not None and holder['expires'] < time.time():
+        return True
+    if holder.get('host') == socket.gethostname() and holder.get('pid') is not None:
+        return not pidAlive(holder['pid'])
+    return False
+
+
+def pidAlive(pid):
+    """
+    Whether a process with the given ID is running on this host.
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def describe(holder):
+    """
+    A readable description of the holder of a lock.
+    """
+    s = holder.get('user', 'an unknown user')
+    if 'pid' in holder:
+        s += ' (process {} on {}'.format(holder['pid'], holder.get('host'))
+        if holder.get('acquired') is not None:
+            s += ' since {}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(holder['acquired'])))
+        s += ')'
+    return s
@@ -0,0 +1,79 @@
+"""
+Propagation of asymmetric errors through functions of several quantities, evaluated on whole arrays at once. Each
+function takes the lists of value, positive error, and negative error arrays of the inputs (one array per input, all
+the same length) and returns the value, positive error, and negative error arrays of func(*values). Missing errors are
+taken to be symmetric where only one side is given, and items without any error on an input get null errors.
+
+Used by SciCatalog.derive.
+"""
+from __future__ import division, print_function, absolute_import
+import numpy as np
+
+chunkBytes = 2**26
+
+# the percentiles of a normal distribution one standard deviation below and above the mean
+_sigmaPercentiles = [15.865525393145708, 84.13447460685429]
+
+
+def linear(func, values, errpos, errneg):
+    """
+    Propagate the errors by shifting each input by its positive and negative error in turn (2 evaluations of func per
+    input) and adding the resulting upward and downward changes in func in quadrature. This is first order error
+    propagation that allows for asymmetric errors and for func decreasing with some of its inputs.
+    """
+    values, errpos, errneg = _prepare(values, errpos, errneg)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        center = _evaluate(func, values)
+        up2, down2 = np.zeros_like(center), np.zeros_like(center)
+        for i in range(len(values)):
+            deltas = []
+            for shift in [errpos[i], -errneg[i]]:
+                shifted = list(values)
+                shifted[i] = values[i] + shift
+                deltas.append(_evaluate(func, shifted) - center)
+            up2 += np.maximum(np.maximum(deltas[0], deltas[1]), 0)**2
+            down2 += np.maximum(np.maximum(-deltas[0], -deltas[1]), 0)**2
+    return center, np.sqrt(up2), np.sqrt(down2)
+
+
+def montecarlo(func, values, errpos, errneg, nsamples=1000, chunkSize=None, seed=None):
+    """
+    Propagate the errors by drawing nsamples samples of each input from a split normal distribution (a half normal
+    with the negative error below the value and one with the positive error above it), evaluating func on all of them
+    at once, and taking the 1-sigma percentiles of the results relative to func evaluated at the values.
+
+    The items are processed chunkSize at a time so that the samples take up about chunkBytes of memory at most.
+    seed seeds the random number generator.
+    """
+    values, errpos, errneg = _prepare(values, errpos, errneg)
+    n = len(values[0])
+    if chunkSize is None:
+        chunkSize = max(1, chunkBytes // (8*nsamples*(len(values) + 1)))
+    rng = np.random.default_rng(seed)
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        center = _evaluate(func, values)
+        lo, hi = np.full(n, np.nan), np.full(n, np.nan)
+        for start in range(0, n, chunkSize):
+            chunk = slice(start, min(start + chunkSize, n))
+            samples = []
+            for v, ep, en in zip(values, errpos, errneg):
+                z = rng.standard_normal((nsamples, chunk.stop - chunk.start))
+                samples.append(v[chunk] + z*np.where(z > 0, ep[chunk], en[chunk]))
+            results = np.broadcast_to(np.asarray(func(*samples), dtype=float), samples[0].shape)
+            lo[chunk], hi[chunk] = np.percentile(results, _sigmaPercentiles, axis=0)
+    return center, hi - center, center - lo
+
+
+def _prepare(values, errpos, errneg):
+    """
+    Convert the inputs to float arrays, filling in a missing error on one side with the error on the other.
+    """
+    values, errpos, errneg = [[np.asarray(a, dtype=float) for a in arys] for arys in [values, errpos, errneg]]
+    errpos, errneg = ([np.where(np.isnan(e0), e1, e0) for e0, e1 in zip(errpos, errneg)],
+                      [np.where(np.isnan(e1), e0, e1) for e0, e1 in zip(errpos, errneg)])
+    return values, errpos, errneg
+
+
+def _evaluate(func, values):
+    return np.broadcast_to(np.asarray(func(*values), dtype=float), values[0].shape).copy()
@@ -0,0 +1,141 @@
+"""
+The reference dictionary of a catalog and its file format. Entries are stored one per line as JSON arrays of
+[key, definition], so definitions can hold any text. When a dictionary is read, only the keys are parsed; each
+definition is parsed the first time it is used, and entries that are never touched are written back out verbatim.
+
+Dictionaries in the original format of 'key : definition' lines can still be read.
+"""
+from __future__ import division, print_function, absolute_import
+import json
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+suffix = 'jsonl'
+legacySuffix = 'txt'
+_decoder = json.JSONDecoder()
+
+
+class _Unparsed:
+    """
+    A line of a reference dictionary file whose definition hasn't been parsed yet.
+    """
+    __slots__ = ['line']
+
+    def __init__(self, line):
+        self.line = line
+
+    def parse(self):
+        return json.loads(self.line)[1]
+
+
+class RefDict(MutableMapping):
+    """
+    A dictionary of reference definitions keyed by reference key that parses definitions read from a file only when
+    they are used. Takes the same arguments as dict.
+    """
+    def __init__(self, *args, **kws):
+        self._items = {}
+        if len(args) == 1 and isinstance(args[0], RefDict):
+            self._items.update(args[0]._items)
+            args = ()
+        self.update(*args, **kws)
+
+    @classmethod
+    def fromLines(cls, lines):
+        """
+        Create a RefDict from the lines of a reference dictionary file, parsing only the keys. Where a key appears
+        more than once, the last line wins.
+        """
+        new = cls()
+        for line in lines:
+            line = line.strip()
+            if line:
+                # the key is the first element of the array, so decode just that much
+                key, _ = _decoder.raw_decode(line, line.index('[') + 1)
+                new._items[key] = _Unparsed(line)
+        return new
+
+    def lines(self):
+        """
+        Return the lines of the file representing the dictionary, reusing the text read from a file where possible.
+        """
+        return [item.line if isinstance(item, _Unparsed) else json.dumps([key, item])
+                for key, item in self._items.items()]
+
+    def copy(self):
+        return RefDict(self)
+
+    def __getitem__(self, key):
+        item = self._items[key]
+        if isinstance(item, _Unparsed):
+            item = self._items[key] = item.parse()
+        return item
+
+    def __setitem__(self, key, definition):
+        self._items[key] = definition
+
+    def __delitem__(self, key):
+        del self._items[key]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __eq__(self, other):
+        if not isinstance(other, RefDict):
+            return MutableMapping.__eq__(self, other)
+        return self._items.keys() == other._items.keys() and not changedKeys(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+def changedKeys(new, old):
+    """
+    Return the keys of the new reference dictionary whose entries are missing from or different in the old one,
+    without parsing definitions that were read from identical lines.
+    """
+    new, old = RefDict(new), RefDict(old)
+    changed = []
+    for key, item in new._items.items():
+        if key not in old._items:
+            changed.append(key)
+            continue
+        oldItem = old._items[key]
+        if item is oldItem or (isinstance(item, _Unparsed) and isinstance(oldItem, _Unparsed)
+                               and item.line == oldItem.line):
+            continue
+        if new[key] != old[key]:
+            changed.append(key)
+    return changed
+
+
+def read(path):
+    """
+    Read the reference dictionary file at path, in either the JSON lines format or the original 'key : definition'
+    format (recognized by the file suffix).
+    """
+    with open(path) as f:
+        lines = f.read().splitlines()
+    if path.endswith('.' + legacySuffix):
+        return RefDict(line.split(' : ', 1) for line in lines if line)
+    return RefDict.fromLines(lines)
+
+
+def write(refDict, path):
+    """
+    Write a reference dictionary (or plain dict) to path in the JSON lines format.
+    """
+    lines = RefDict(refDict).lines()
+    with open(path, 'w') as f:
+        f.write(''.join(line + '\n' for line in lines))
@@ -4,7 +4,16 @@ import os
 import numpy as np
 from warnings import warn
 import time
-import getpass
+import shutil
+import json
+import warnings
+from contextlib import contextmanager
+from . import storage
+from . import locking
+from . import cache
+from . import refdict
+from . import view
+from . import propagate
 
 class SciCatalog:
     """
@@ -22,14 +31,28 @@ class SciCatalog:
 
     keys = ['value', 'errpos', 'errneg', 'ref']
     tableFiles = ['values', 'errors_positive', 'errors_negative', 'references']
-    fileSuffix = 'csv'
+    defaultFormat = 'csv'
     nullValues = [np.nan, np.nan, np.nan, 'none']
     refDictFile = 'reference_dictionary'
-    refFileSuffix = 'txt'
-    accessFile = 'user_accessing.txt'
+    refFileSuffix = 'jsonl'
+    legacyRefFileSuffix = 'txt'
+    lockFile = 'catalog.lock'
+    dataLockFile = 'data.lock'
+    lockLease = None
+    deltaFile = 'delta.json'
+    snapshotEvery = 10
+    journalFile = 'journal.jsonl'
+    journalLimit = 1000
+    _journalOps = ['set', 'update', 'addRows', 'addCols', 'renameCol', 'renameRow', 'addRefEntry',
+                   'removeRefEntries']
+    manifestFile = 'manifest.json'
+    stagingPrefix = '.staging'
+    sparseBelow = 0.5
+    mergeReportFile = 'merge_conflicts.csv'
 
     def __init__(self, path, values=None, errpos=None, errneg=None, refs=None, refDict={}, index=None, columns=None,
-                 readOnly=False, silent=False):
+                 readOnly=False, silent=False, format=None, lazy=False, holdLock=True, timeout=0,
+                 lowMemory=False, float32=False):
         """
         Creates an empty SciCatalog object by intializing the four pandas DataFrame tables and a reference dictionary
         that are kept synced to the disk as changes are made.
@@ -48,9 +71,36 @@ class SciCatalog:
         readOnly : True|False
             If True, access the table in read only mode. This allows you to open the table even when it is in use by
             another user, but prevents you from saving any changes you make to it.
-
-        Other **kwargs will be passed along to DataFrame call. See DataFrame documentation for info, but important
-        ones include index and columns for providing lists of indices and column names.
+        holdLock : True|False
+            If True, the write lock on the catalog is held from when it is opened or created until close is called (or
+            the process exits), so no one else can edit it in the meantime. If False, the lock is taken only for loading
+            the catalog and then within locked blocks, which is how parallel workers should share a catalog. Edits
+            can only be made within a locked block in that case.
+        timeout : float
+            Seconds to wait for another user or process to release the write lock when opening the catalog for
+            editing. The default, 0, fails right away with a locking.LockTimeout. None waits indefinitely.
+        format : str
+            Storage format for the table files of a new catalog, one of the keys of storage.backends ('csv', 'npz',
+            'parquet'). Defaults to SciCatalog.defaultFormat. The format of an existing catalog is detected from its
+            files, so this is ignored when loading.
+
+        lazy : True|False
+            If True when loading an existing catalog, each table is read from the disk only when it is first
+            accessed, so a script that only needs, e.g., the values pays nothing for the other tables. All of the
+            tables are read right away regardless if there are edits in the journal to replay. In read-write mode,
+            the backup made when the catalog is opened is put off until the first edit is written to the disk.
+        lowMemory : True|False
+            If True, the tables are kept in a compact form in memory: reference keys as pandas Categoricals and
+            error columns that are mostly null as sparse arrays. This is transparent to the catalog methods, though
+            each edit then costs time proportional to the number of rows rather than constant time.
+        float32 : True|False
+            If True, the values and errors are held as single precision floats to halve their memory. Only allowed
+            in read only mode, since saving would round every item.
+
+        index and columns provide lists of indices and column names for a new catalog. When loading an existing
+        catalog in read only mode, they instead restrict the rows and columns that are read from the disk (and the
+        binary storage formats will then parse only those). They are ignored (with a warning) when loading in
+        read-write mode.
 
         Returns
         -------
@@ -58,6 +108,13 @@ class SciCatalog:
 
         """
 
+        if os.path.exists(path) and (index is not None or columns is not None) and not readOnly:
+            warn('The rows and columns of an existing catalog can only be restricted in read only mode, otherwise '
+                 'saving would drop the rest of the catalog. Loading the full catalog.')
+            index = columns = None
+        if float32 and not readOnly:
+            raise ValueError('float32 is only allowed in read only mode, since saving would round every value to single '
+                             'precision.')
         if os.path.exists(path) and values is not None:
             raise Exception('A directory named {} already exists at {}. You must use a different name or manually '
                             'delete that directory before you an create the catalog you want at that disk location. '
@@ -66,11 +123,32 @@ class SciCatalog:
         # store auxilliary data
         self.path = path
         self.name = os.path.basename(path)
-        self.paths  = self._tablepaths(path)
+        self.storage = storage.getBackend(self.defaultFormat if format is None else format)
+        self.paths  = self._tablepaths(path, self.fileSuffix)
         self.archive = os.path.join(path, 'archive')
-        self.refDict = refDict
+        self.refDict = refdict.RefDict(refDict)
         self.refDictPath = os.path.join(path, self.refDictFile) + '.' + self.refFileSuffix
+        self.journalPath = os.path.join(path, self.journalFile)
         self.readOnly = readOnly
+        self._batchDepth = 0
+        self._pendingOps = []
+        self._journalLength = 0
+        self._replaying = False
+        self._lastBackup = None
+        self._backupPending = False
+        self._tables = [None]*len(self.tableFiles)
+        self._hashes = [None]*len(self.tableFiles)
+        self._journaledHashes = [None]*len(self.tableFiles)
+        self._journaledRefDict = refdict.RefDict()
+        self._modCount = 0
+        self._generation = 0
+        self._rows, self._columns = index, columns
+        self.lowMemory = lowMemory
+        self.float32 = float32
+        self._refIndex = None
+        self._lock = None
+        self._holdLock = holdLock
+        self._dataLockDepth = 0
 
         # either load or create the SciCat table as appropriate
         if os.path.exists(path):
@@ -78,40 +156,30 @@ class SciCatalog:
                 if not silent:
                     print("Opening the catalog in read only mode. *You will not be able to save any changes you make to "
                           "the catalog in this mode.* You do not need to call the close() method when finished.")
-            else:
-                # try to prevent possible editing by multiple users at the same time by looking for or creating a file
-                # that just contains the name of the user, to be later removed with the close() method.
-                self._accessPath = os.path.join(path, self.accessFile)
-                if os.path.exists(self._accessPath):
-                    with open(self._accessPath) as f:
-                        user = f.readline().strip()
-                    raise Exception('Cannot load the catalog because it is currently in use by {u}. If you are '
-                                    'certain that {u} is no longer modifying the catalog and just forgot to call the '
-                                    '"close" method (better check with him/her!), you can delete the {a} file in the '
-                                    'catalog directory to regain access.'.format(u=user, a=self.accessFile))
-                elif 'archive' not in self.path:
-                    if not silent:
-                        print("IMPORTANT: You MUST use execute the command '{c}.close()' when you are done "
-                              "modifying the {c} catalog or other users will not be able to open and edit it."
-                              "".format(c=self.name))
-                    with open(self._accessPath, 'w') as f:
-                        f.write(getpass.getuser())
-
-            # load in the table data
-            self.tables = [pd.read_csv(p) for p in self.paths]
-            self.values, self.errpos, self.errneg, self.refs = self.tables
-
-            # load in the reference dictionary
-            refs, defs = [], []
-            with open(self.refDictPath) as f:
-                lines = f.read().splitlines()
-                pairs = [line.split(' : ') for line in lines]
-            self.refDict = dict(pairs)
-
-            # make a backup copy
-            if not self.readOnly:
-                if 'archive' not in path:
-                    self.backup()
+            elif 'archive' not in self.path:
+                # prevent editing by multiple users at the same time with a lock that is released by the close()
+                # method (or by the operating system if the process exits without calling it)
+                self._lock = locking.FileLock(os.path.join(path, self.lockFile), self.lockLease)
+                self._acquireLock(timeout)
+                if holdLock and not silent:
+                    self._printLockNotice()
+
+            try:
+                if not self.readOnly:
+                    self._recover()
+
+                self._load(index, columns, lazy)
+
+                # make a backup copy (when loading lazily, not until it's needed so the tables needn't be read)
+                if not self.readOnly:
+                    if 'archive' not in path:
+                        if lazy:
+                            self._backupPending = True
+                        else:
+                            self.backup()
+            finally:
+                if not holdLock and self._lock is not None:
+                    self._lock.release()
 
         else:
             # functions to create DataFrames filled with null or good data as appropriate
@@ -120,19 +188,158 @@ class SciCatalog:
             DF = lambda data, val: nullDF(val) if data is None else goodDF(data)
 
             # create tables
-            self.tables = list(map(DF, [values, errpos, errneg, refs], self.nullValues))
-            self.values, self.errpos, self.errneg, self.refs = self.tables
+            self._setTables(map(DF, [values, errpos, errneg, refs], self.nullValues))
+            self._setTables([self._shrink(i, tbl) for i, tbl in enumerate(self.tables)])
+            for i in range(len(self._tables)):
+                self._rememberHashes(i)
+            self._refDictAtOpen = refdict.RefDict(self.refDict)
+            self._journaledRefDict = refdict.RefDict(self.refDict)
 
             # check that all reference keys are defined
-            for ref in self.refs.values.ravel():
-                self.checkRef(ref)
+            self.checkRefs()
 
             # write to disk
             if not os.path.exists(path):
                 os.mkdir(path)
             if not os.path.exists(self.archive):
                 os.mkdir(self.archive)
-            self.save()
+            self._lock = locking.FileLock(os.path.join(path, self.lockFile), self.lockLease)
+            self._acquireLock(timeout)
+            try:
+                self.save()
+            finally:
+                if not holdLock:
+                    self._lock.release()
+            if holdLock and not silent:
+                self._printLockNotice()
+
+
+    def _printLockNotice(self):
+        """
+        Tell the user that the catalog stays locked until it is closed.
+        """
+        print("IMPORTANT: Other users will not be able to open and edit the {c} catalog until you execute the command "
+              "'{c}.close()' or this session ends.".format(c=self.name))
+
+
+    def _load(self, index, columns, lazy):
+        """
+        Load the catalog from the generation of files named in the manifest, replaying the journal on top of them.
+
+        In read only mode, the load is repeated if the catalog is saved by another process while its files are being
+        read, so that the tables always come from a single generation (lazy loads excepted).
+        """
+        while True:
+            manifest = self._readManifest(self.path)
+            self._generation = manifest['generation']
+            fileDir = self.path if manifest['staged'] is None else os.path.join(self.path, manifest['staged'])
+            self._tables = [None]*len(self.tableFiles)
+            self._hashes = [None]*len(self.tableFiles)
+            self._journaledHashes = [None]*len(self.tableFiles)
+            self._refIndex = None
+            self._rows, self._columns = index, columns
+            try:
+                with self._filesLocked(shared=True):
+                    self._loadFiles(fileDir, index, columns, lazy)
+            except (IOError, OSError):
+                # a staged generation can be moved into place by its writer while we are reading it
+                if self.readOnly and self._readManifest(self.path)['generation'] != self._generation:
+                    continue
+                raise
+
+            if not self.readOnly or lazy or self._readManifest(self.path)['generation'] == self._generation:
+                break
+
+        self._refDictAtOpen = refdict.RefDict(self.refDict)
+        self._journaledRefDict = refdict.RefDict(self.refDict)
+        self._loadedState = self._diskState()
+
+
+    def _loadFiles(self, fileDir, index, columns, lazy):
+        """
+        Read the reference dictionary and journal and (unless lazy) the tables from the files in fileDir.
+        """
+        self.storage = storage.detectBackend(fileDir, self.tableFiles[0])
+        self.paths = self._tablepaths(fileDir, self.fileSuffix)
+        self.refDictPath = self._refDictPath(fileDir)
+
+        # load in the reference dictionary
+        self.refDict = self._readRefDict(self.refDictPath)
+
+        # replay any edits recorded in the journal since the table files were last written. The journal applies to the
+        # full catalog, so the full tables are read and then restricted to the requested rows and columns
+        journal = self._readJournal()
+        if journal:
+            self._rows = self._columns = None
+            self._replay(journal)
+            if index is not None or columns is not None:
+                rows = slice(None) if index is None else list(index)
+                cols = slice(None) if columns is None else list(columns)
+                self._setTables([tbl.loc[rows, cols] for tbl in self.tables])
+            self._rows, self._columns = index, columns
+            for i in range(len(self._tables)):
+                self._rememberHashes(i)
+
+        # load in the table data, unless deferring that until the tables are accessed
+        if not lazy:
+            for i in range(len(self._tables)):
+                self._table(i)
+
+
+    def refresh(self):
+        """
+        Reload a read only catalog if the catalog has been saved or edited on the disk since it was loaded, which is
+        cheaply detected from the generation in the manifest and the size of the journal. Edits made to this object
+        are discarded if it is reloaded. Does nothing while this object holds the write lock, since the files on the
+        disk can only have been changed by this object.
+
+        Returns
+        -------
+        True if the catalog was reloaded, False if it was already up to date.
+        """
+        if (self._lock is not None and self._lock.held) or self._diskState() == self._loadedState:
+            return False
+        self._modCount = 0
+        self._load(self._rows, self._columns, lazy=False)
+        return True
+
+
+    @contextmanager
+    def locked(self, timeout=None):
+        """
+        Context manager that holds the write lock on a catalog opened with holdLock=False for the duration of the
+        block. On entering, the catalog is reloaded if other processes have changed it. The block is a batch, so the
+        edits made in it are written when it exits (or undone if it raises an exception), before the lock is released.
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait for the lock. Default is to wait indefinitely. A locking.LockTimeout is raised if the lock
+            can't be had in time.
+
+        Example
+        -------
+        >>> cat = SciCatalog('stars', holdLock=False)
+        >>> with cat.locked(timeout=60):
+        ...     cat.set(star, 'distance', d)
+        """
+        if self.readOnly:
+            raise IOError('Cannot lock the catalog for editing because it was opened in read only mode.')
+        if self._lock is None or self._lock.held:
+            with self.batch():
+                yield self
+            return
+
+        self._acquireLock(timeout)
+        try:
+            self._recover()
+            if self._diskState() != self._loadedState:
+                self._modCount = 0
+                self._load(self._rows, self._columns, lazy=False)
+            with self.batch():
+                yield self
+        finally:
+            self._lock.release()
 
 
     def __getitem__(self, key):
@@ -143,31 +350,113 @@ class SciCatalog:
         return len(self.values)
 
 
+    def select(self, rows=None, cols=None):
+        """
+        Return a view of some of the rows and columns of the catalog, which holds only the labels of the selection and
+        copies the selected part of a table when the table is accessed. rows can be a list of labels or a boolean mask
+        over the rows (such as the Series returned by mask), cols a column name or list of names. See
+        view.CatalogView.
+        """
+        return view.CatalogView(self, rows, cols)
+
+
+    def query(self, where=None, cols=None):
+        """
+        Return a view of the rows of the catalog that meet every one of a set of conditions on the values, errors,
+        references, and missing items, keeping the given columns (default is all of them).
+
+        Parameters
+        ----------
+        where : dict or boolean array
+            Dictionary of the conditions on each column, as dictionaries of keywords for mask. Alternatively, a
+            boolean mask over the rows.
+        cols : str or list
+            Columns to keep in the view.
+
+        Returns
+        -------
+        view.CatalogView
+
+        Example
+        -------
+        >>> # rows where distance has S/N > 5 and cites reference a or b
+        >>> cat.query({'distance': dict(snr=5, refs=['a', 'b'])}).values
+        """
+        return view.CatalogView(self).query(where, cols)
+
+
+    def mask(self, col, min=None, max=None, snr=None, relErr=None, refs=None, null=None, hasErr=None):
+        """
+        Return a boolean Series over the rows marking those whose item in column col meets all of the given
+        conditions (see view.CatalogView.mask for the keywords). Masks can be combined with &, |, and ~ and passed to
+        select or query.
+        """
+        return view.CatalogView(self).mask(col, min, max, snr, relErr, refs, null, hasErr)
+
+
     def __eq__(self, other):
+        # same labels (in any order), items equal to within the tolerance of numpy.isclose, nulls equivalent
+        diff = self.diff(other)
+        return not any(diff[k] for k in ['addedRows', 'removedRows', 'addedCols', 'removedCols']) \
+            and len(diff['changed']) == 0 and not any(diff['refDict'].values())
 
-        # check that they have the same columns and indices
-        if sorted(self.colnames) != sorted(other.colnames):
-            return False
-        if sorted(self.indices) != sorted(other.indices):
-            return False
 
-        # compare the values in each column, treating null values as equivalent and just checking if floats are within
-        # tolerance
-        for tbl0, tbl1 in zip(self.tables, other.tables):
-            for col in tbl0.columns:
-                bothnull = tbl0[col].isnull() & tbl1[col].isnull()
-                if tbl0[col].dtype == float:
-                    ne = ~np.isclose(tbl0[col], tbl1[col])
-                else:
-                    ne = tbl0[col] != tbl1[col]
-                ne[bothnull.values] = False
-                if ne.any():
-                    return False
+    def diff(self, other, rtol=1e-05, atol=1e-08):
+        """
+        Find the differences between this catalog and another, going from this one to the other.
 
-        if self.refDict != other.refDict:
-            return False
+        The tables are aligned on their row and column labels before being compared, so the order of the rows and
+        columns doesn't matter. Numerical items are compared with numpy.isclose using rtol and atol, other items must
+        be identical, and null items are equivalent to one another.
+
+        Parameters
+        ----------
+        other : SciCatalog
+            The catalog to compare against.
+        rtol, atol : float
+            Relative and absolute tolerance for numerical items.
+
+        Returns
+        -------
+        diff : dict
+            addedRows, removedRows, addedCols, removedCols : lists of the rows and columns that are only in the other
+                catalog (added) or only in this one (removed)
+            changed : DataFrame with columns index, col, key, old, and new giving each item in the shared rows and
+                columns that differs, where key is one of 'value', 'errpos', 'errneg', 'ref'
+            refDict : dictionary with 'added' and 'removed' dictionaries of the reference entries only in the other
+                catalog or only in this one and a 'changed' dictionary of (old, new) definitions
+        """
+        return self._diffTables(other.tables, other.refDict, rtol, atol)
 
-        return True
+
+    def _diffTables(self, tables, refDict, rtol=1e-05, atol=1e-08):
+        """
+        Like diff, but compares against a list of tables and a reference dictionary.
+        """
+        index0, columns0 = self.values.index, self.values.columns
+        index1, columns1 = tables[0].index, tables[0].columns
+        index, columns = index0.intersection(index1, sort=False), columns0.intersection(columns1, sort=False)
+
+        changed = []
+        for key, tbl0, tbl1 in zip(self.keys, self.tables, tables):
+            tbl0 = tbl0.reindex(index=index, columns=columns)
+            tbl1 = tbl1.reindex(index=index, columns=columns)
+            rows, cols = np.nonzero(_unequalItems(tbl0, tbl1, rtol, atol))
+            changed.append(pd.DataFrame(dict(index=index[rows], col=columns[cols], key=key,
+                                             old=tbl0.to_numpy(dtype=object)[rows, cols],
+                                             new=tbl1.to_numpy(dtype=object)[rows, cols])))
+        changed = pd.concat(changed, ignore_index=True)
+
+        changedKeys = refdict.changedKeys(refDict, self.refDict)
+        refDiff = dict(added=dict((k, refDict[k]) for k in changedKeys if k not in self.refDict),
+                       removed=dict((k, self.refDict[k]) for k in self.refDict if k not in refDict),
+                       changed=dict((k, (self.refDict[k], refDict[k])) for k in changedKeys if k in self.refDict))
+
+        return dict(addedRows=list(index1.difference(index0, sort=False)),
+                    removedRows=list(index0.difference(index1, sort=False)),
+                    addedCols=list(columns1.difference(columns0, sort=False)),
+                    removedCols=list(columns0.difference(columns1, sort=False)),
+                    changed=changed, refDict=refDiff)
 
 
     def __ne__(self, other):
@@ -196,7 +485,7 @@ class SciCatalog:
         """
         data = [value, errpos, errneg, ref]
 
-        iterI, iterC = [type(x) in [tuple, list] for x in [index, col]]
+        iterI, iterC = [isinstance(x, (tuple, list, np.ndarray, pd.Series, pd.Index)) for x in [index, col]]
 
         if iterI and iterC:
             raise TypeError('Only one of index and col can be a list or tuple.')
@@ -209,40 +498,233 @@ class SciCatalog:
                     raise ValueError('Given your input for index and col, value, errpos, errneg, and ref must all be '
                                      'iterables of length {} or be None.'.format(n))
 
-        if iterI:
-            groomLen(len(index))
-            for i, v, ep, en, r in zip(index, *data):
-                self._setSingle(i, col, v, ep, en, r)
-        elif iterC:
-            groomLen(len(col))
-            for c, v, ep, en, r in zip(col, *data):
-                self._setSingle(index, c, v, ep, en, r)
+        # record the edit before making it so that an edit that can't be journaled leaves the catalog unchanged
+        op = self._encodeOp(['set', index, col, value, errpos, errneg, ref])
+
+        tables = [i for i, d in enumerate(data) if d is not None]
+        with self._tracking(list(index) if iterI else [index], list(col) if iterC else [col], tables):
+            if iterI:
+                groomLen(len(index))
+                for i, v, ep, en, r in zip(index, *data):
+                    self._setSingle(i, col, v, ep, en, r)
+            elif iterC:
+                groomLen(len(col))
+                for c, v, ep, en, r in zip(col, *data):
+                    self._setSingle(index, c, v, ep, en, r)
+            else:
+                self._setSingle(index, col, *data)
+
+        self.checkRefs([r for r in (data[3] if iterI or iterC else [data[3]]) if r is not None])
+
+        self._sync(op)
+
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager for grouping many edits into a single write to the disk.
+
+        Within the block, changes made with the catalog methods (set, update, addRow, addCol, renameCol, renameRow,
+        addRefEntry) are kept in memory only. They are appended to the journal in a single write when the block exits
+        normally. If an exception is raised within the block, the tables and reference dictionary are restored to
+        their state at the start of the block and the exception is re-raised. Blocks can be nested, in which case only
+        the outermost block writes or rolls back.
+
+        Example
+        -------
+        >>> with cat.batch():
+        ...     for star, d in distances.items():
+        ...         cat.set(star, 'distance', d)
+        """
+        outermost = self._batchDepth == 0
+        if outermost:
+            snapshot = ([tbl.copy() for tbl in self.tables], refdict.RefDict(self.refDict), self._modCount,
+                        [None if h is None else dict(h) for h in self._journaledHashes],
+                        refdict.RefDict(self._journaledRefDict))
+        self._batchDepth += 1
+        try:
+            yield self
+        except:
+            self._batchDepth -= 1
+            if outermost:
+                tables, self.refDict, self._modCount, self._journaledHashes, self._journaledRefDict = snapshot
+                self._setTables(tables)
+                self._refIndex = None
+                self._pendingOps = []
+            raise
         else:
-            self._setSingle(index, col, *data)
+            self._batchDepth -= 1
+            if outermost:
+                self._flushJournal()
 
-        if not self.readOnly:
-            self.save()
+
+    def update(self, values=None, errpos=None, errneg=None, refs=None, index=None, columns=None, addMissing=False):
+        """
+        Set a whole block of the catalog at once, overwriting every item in the block with the data given (null values
+        included) and save to disk.
+
+        Parameters
+        ----------
+        values, errpos, errneg, refs : DataFrame or 2D array-like
+            New data for the respective tables. DataFrames are placed according to their own index and columns. Other
+            array-likes must be accompanied by the index and columns keywords and have shape (len(index),
+            len(columns)). Tables given as None are left untouched.
+        index, columns : list
+            Row and column labels for array-like input.
+        addMissing : True|False
+            If True, rows and columns that are not yet in the catalog are added (initialized with null values) before
+            the data are set. Otherwise a KeyError is raised for any such row or column.
+
+        Returns
+        -------
+        None
+        """
+        data = [values, errpos, errneg, refs]
+        blocks = []
+        for d in data:
+            if d is None:
+                blocks.append(None)
+            elif isinstance(d, pd.DataFrame):
+                blocks.append(d)
+            else:
+                if index is None or columns is None:
+                    raise ValueError('index and columns must be given when the data are not DataFrames.')
+                blocks.append(pd.DataFrame(np.asarray(d), index=index, columns=columns))
+        if all(b is None for b in blocks):
+            return
+        op = self._encodeOp(['update'] + [None if b is None else _splitDict(b) for b in blocks]
+                            + [None, None, addMissing])
+
+        # add or complain about rows and columns that aren't in the catalog yet
+        newrows, newcols = [], []
+        for b in blocks:
+            if b is not None:
+                newrows.extend(b.index.difference(self.values.index, sort=False).difference(newrows, sort=False))
+                newcols.extend(b.columns.difference(self.values.columns, sort=False).difference(newcols, sort=False))
+        if (newrows or newcols) and not addMissing:
+            missing = ', '.join(map(str, newrows + newcols))
+            raise KeyError("{} are not rows/columns in the table. Use addMissing=True or the 'addRow' and 'addCol' "
+                           "methods to add them before setting values in them.".format(missing))
+
+        blockrows = list(pd.unique(np.concatenate([b.index.to_numpy(dtype=object) for b in blocks if b is not None])))
+        blockcols = list(pd.unique(np.concatenate([b.columns.to_numpy(dtype=object) for b in blocks if b is not None])))
+        with self._tracking(*((None, None) if newrows or newcols else (blockrows, blockcols))):
+            if newrows or newcols:
+                rows = self.values.index.append(pd.Index(newrows)) if newrows else self.values.index
+                cols = self.values.columns.append(pd.Index(newcols)) if newcols else self.values.columns
+                self._setTables([tbl.reindex(index=rows, columns=cols, fill_value=val)
+                                 for tbl, val in zip(self.tables, self.nullValues)])
+
+            if blocks[3] is not None:
+                b = blocks[3]
+                self._indexRefs(b.index, b.columns, self.refs.loc[b.index, b.columns].to_numpy(dtype=object), b.values)
+
+            # one assignment per table
+            self._loosen(blockcols)
+            for tbl, b in zip(self.tables, blocks):
+                if b is not None:
+                    tbl.loc[b.index, b.columns] = b.values
+            self._tighten(blockcols)
+
+        if blocks[3] is not None:
+            self.checkRefs(blocks[3].values)
+
+        self._sync(op)
+
+
+    def _acquireLock(self, timeout):
+        """
+        Acquire the write lock, explaining who has it if that fails.
+        """
+        try:
+            self._lock.acquire(timeout=timeout)
+        except locking.LockTimeout as e:
+            raise locking.LockTimeout('Cannot edit the catalog because it is currently in use by {}. You can still open '
+                                      'it with readOnly=True, or give a timeout to wait for it to be released.'
+                                      ''.format(locking.describe(e.holder or {})), e.holder)
+
+
+    @contextmanager
+    def _filesLocked(self, shared):
+        """
+        Context manager holding the lock on the catalog files, shared while reading them and exclusive while writing
+        them. Read only catalogs in directories where the lock file can't be created are read without it.
+        """
+        if self._dataLockDepth > 0:
+            self._dataLockDepth += 1
+            try:
+                yield
+            finally:
+                self._dataLockDepth -= 1
+            return
+
+        lock = locking.FileLock(os.path.join(self.path, self.dataLockFile))
+        try:
+            lock.acquire(shared=shared)
+        except (IOError, OSError):
+            if not self.readOnly:
+                raise
+            lock = None
+        self._dataLockDepth += 1
+        try:
+            yield
+        finally:
+            self._dataLockDepth -= 1
+            if lock is not None:
+                lock.release()
+
+
+    def _checkLock(self):
+        """
+        Raise an error if changes are about to be written without holding the write lock.
+        """
+        if self._lock is not None and not self._lock.held:
+            if self._holdLock:
+                raise IOError('The {} catalog has been closed, so changes to it can no longer be saved. This edit was '
+                              'made in memory only.'.format(self.name))
+            raise IOError('The catalog was opened with holdLock=False, so edits can only be saved within a '
+                          '"with {}.locked():" block. This edit was made in memory only.'.format(self.name))
+
+
+    def _recover(self):
+        """
+        Finish a save that was interrupted after it was committed and clear out any that weren't committed.
+        """
+        manifest = self._readManifest(self.path)
+        if manifest['staged'] is not None:
+            self._generation = manifest['generation']
+            self._install(manifest['staged'])
+        self._clearStaging()
 
 
     def close(self):
         """
         Close the catalog, making it available for other users to open and edit.
+
+        Only the edits made with the catalog methods are recorded in the journal as they happen. If the tables or the
+        reference dictionary have also been edited directly, the catalog is saved in full before it is closed so that
+        those edits aren't lost.
         """
         if not self.readOnly:
+            hashes = [None if tbl is None else _columnHashes(tbl) for tbl in self._tables]
+            if self._hasUnjournaledEdits(hashes):
+                if self._lock is None or self._lock.held:
+                    self.save()
+                else:
+                    warn('The tables or reference dictionary of {} were edited directly, and those edits can only be '
+                         'saved while holding the lock. They were not saved. Call save() within a "with cat.locked():" '
+                         'block before closing to keep them.'.format(self.name))
+
             # if the catalog hasn't changed during this session, delete the backup made when it was opened
             # check if it hasn't changed by comparing it to the backup made when it was opened
-            archivePaths = self._listpaths(self.archive)
-            backupDirs = list(filter(os.path.isdir, archivePaths))
-            if len(backupDirs) > 0:
-                lastBackupDir = max(backupDirs)
-                backup = SciCatalog(lastBackupDir)
-                if backup == self:
-                    for f in self._listpaths(lastBackupDir):
-                        os.remove(f)
-                    os.rmdir(lastBackupDir)
+            if self._lastBackup is not None:
+                if not self._isModified(hashes):
+                    shutil.rmtree(os.path.join(self.archive, self._lastBackup))
+                self._lastBackup = None
 
-            # remove the file showing that the user is accessing the catalog
-            os.remove(self._accessPath)
+            # release the lock so that others can edit the catalog
+            if self._lock is not None:
+                self._lock.release()
 
 
     def _setSingle(self, index, col, value=None, errpos=None, errneg=None, ref=None):
@@ -256,13 +738,15 @@ class SciCatalog:
             raise KeyError("{} is not a column in the table. You must use the 'addCol' method to add a column before "
                            "setting values in it.".format(col))
 
+        if ref is not None:
+            self._indexRefs([index], [col], [[self.refs.at[index, col]]], [[ref]])
+
         kwargs = dict(list(zip(self.keys, [value, errpos, errneg, ref])))
+        self._loosen([col])
         for i, key in enumerate(self.keys):
             if kwargs[key] is not None:
                 self.tables[i].at[index, col] = kwargs[key]
-
-        if 'ref' in kwargs:
-            self.checkRef(kwargs['ref'])
+        self._tighten([col])
 
     def strItem(self, index, col):
         """
@@ -285,19 +769,173 @@ class SciCatalog:
 
     def backup(self):
         """
-        Backup the catalog by saving a copy of it in the archive subdirectory in a date+time stamped directory.
+        Backup the catalog in a date+time stamped directory in the archive subdirectory.
+
+        Most backups are incremental, recording only the items (and reference dictionary entries) that differ from
+        the most recent full snapshot of the catalog. A full snapshot is written instead when there is none yet, when
+        snapshotEvery incremental backups have been made since the last one, or when most of the catalog has changed.
+
+        Returns
+        -------
+        The date+time stamp identifying the backup.
         """
 
         strTime = time.strftime("%Y%m%dT%H%M%S")
-        archiveDir = os.path.join(self.path, 'archive', strTime)
+        archiveDir = os.path.join(self.archive, strTime)
+        # several processes can back the catalog up within the same second
+        n = 1
+        while os.path.exists(archiveDir):
+            strTime = '{}_{}'.format(strTime.split('_')[0], n)
+            archiveDir = os.path.join(self.archive, strTime)
+            n += 1
+        if not os.path.exists(self.archive):
+            os.mkdir(self.archive)
+
+        # try an incremental backup against the latest snapshot
+        delta = None
+        versions = self.listVersions()
+        snapshots = [i for i, (_, kind) in enumerate(versions) if kind == 'snapshot']
+        if snapshots and len(versions) - 1 - snapshots[-1] < self.snapshotEvery:
+            delta = self._delta(versions[snapshots[-1]][0])
+            nchanged = sum(len(changes) for changes in delta['changes'].values())
+            if nchanged > self.values.size*len(self.keys) // 2:
+                delta = None
+
         os.mkdir(archiveDir)
+        if delta is None:
+            # tables that haven't been loaded yet are unchanged on the disk and can just be copied
+            tblPaths = self._tablepaths(archiveDir, self.fileSuffix)
+            for tbl, path, bkpath in zip(self._tables, self.paths, tblPaths):
+                if tbl is None:
+                    shutil.copyfile(path, bkpath)
+                else:
+                    self.storage.write(_plain(tbl), bkpath)
+
+            refPath = os.path.join(archiveDir, self.refDictFile) + '.' + self.refFileSuffix
+            self._saveRefDict(refPath)
+        else:
+            with open(os.path.join(archiveDir, self.deltaFile), 'w') as f:
+                json.dump(delta, f)
 
-        tblPaths = [os.path.join(archiveDir, name) + '.' + self.fileSuffix for  name in self.tableFiles]
-        for tbl, path in zip(self.tables, tblPaths):
-            tbl.to_csv(path)
+        self._lastBackup = strTime
+        return strTime
 
-        refPath = os.path.join(archiveDir, self.refDictFile) + '.' + self.refFileSuffix
-        self._saveRefDict(refPath)
+
+    def listVersions(self):
+        """
+        Return a list of (stamp, kind) tuples for the backups in the archive, oldest first, where kind is 'snapshot'
+        for full copies of the catalog and 'delta' for incremental backups.
+        """
+        if not os.path.exists(self.archive):
+            return []
+        versions = []
+        for stamp in sorted(os.listdir(self.archive)):
+            path = os.path.join(self.archive, stamp)
+            if os.path.isdir(path):
+                isdelta = os.path.exists(os.path.join(path, self.deltaFile))
+                versions.append((stamp, 'delta' if isdelta else 'snapshot'))
+        return versions
+
+
+    def getVersion(self, stamp):
+        """
+        Reconstruct a backed up version of the catalog.
+
+        Parameters
+        ----------
+        stamp : str
+            Date+time stamp of the backup, as listed by listVersions.
+
+        Returns
+        -------
+        tables, refDict
+            List of the values, errpos, errneg, and refs DataFrames and the reference dictionary of that version.
+        """
+        path = os.path.join(self.archive, stamp)
+        deltaPath = os.path.join(path, self.deltaFile)
+        if not os.path.exists(deltaPath):
+            backend = storage.detectBackend(path, self.tableFiles[0])
+            tblPaths = self._tablepaths(path, backend.suffix)
+            tables = [backend.read(p, ref=(key == 'ref')) for p, key in zip(tblPaths, self.keys)]
+            refDict = self._readRefDict(self._refDictPath(path))
+            return tables, refDict
+
+        with open(deltaPath) as f:
+            delta = json.load(f)
+        tables, refDict = self.getVersion(delta['base'])
+        tables = [tbl.reindex(index=delta['index'], columns=delta['columns'], fill_value=val)
+                  for tbl, val in zip(tables, self.nullValues)]
+        for tbl, key, val in zip(tables, self.keys, self.nullValues):
+            for index, col, item in delta['changes'][key]:
+                tbl.at[index, col] = val if item is None else item
+        refDict.update(delta['refDict']['set'])
+        for refkey in delta['refDict']['removed']:
+            del refDict[refkey]
+        return tables, refDict
+
+
+    def restoreVersion(self, stamp, path):
+        """
+        Create a new catalog at path from a backed up version of this one and return it.
+        """
+        tables, refDict = self.getVersion(stamp)
+        return SciCatalog(path, *tables, refDict=refDict, format=self.format)
+
+
+    def pruneArchive(self, keep=None, before=None):
+        """
+        Delete old backups from the archive. Snapshots needed to reconstruct the incremental backups that remain are
+        always kept.
+
+        Parameters
+        ----------
+        keep : int
+            Keep only this many of the most recent backups.
+        before : str
+            Delete backups with a date+time stamp (formatted as YYYYmmddTHHMMSS) earlier than this.
+
+        Returns
+        -------
+        List of the stamps of the deleted backups.
+        """
+        versions = self.listVersions()
+        stamps = [stamp for stamp, _ in versions]
+        drop = set()
+        if keep is not None:
+            drop.update(stamps[:max(len(stamps) - keep, 0)])
+        if before is not None:
+            drop.update(stamp for stamp in stamps if stamp < before)
+
+        # spare the base snapshots of the surviving incremental backups
+        for stamp, kind in versions:
+            if kind == 'delta' and stamp not in drop:
+                with open(os.path.join(self.archive, stamp, self.deltaFile)) as f:
+                    drop.discard(json.load(f)['base'])
+
+        drop = sorted(drop)
+        for stamp in drop:
+            shutil.rmtree(os.path.join(self.archive, stamp))
+        return drop
+
+
+    def _delta(self, base):
+        """
+        Return a json-friendly dictionary recording the differences between the catalog and the snapshot with stamp
+        base.
+        """
+        oldTables, oldRefDict = self.getVersion(base)
+        index, columns = self.values.index, self.values.columns
+        changes = {}
+        for key, old, new, val in zip(self.keys, oldTables, self.tables, self.nullValues):
+            old = old.reindex(index=index, columns=columns, fill_value=val)
+            newary = new.to_numpy(dtype=object)
+            rows, cols = np.nonzero(_unequalItems(old, new, rtol=0, atol=0))
+            changes[key] = [[_jsonable(index[i]), _jsonable(columns[j]), _jsonable(newary[i, j])]
+                            for i, j in zip(rows, cols)]
+        refSet = dict((k, self.refDict[k]) for k in refdict.changedKeys(self.refDict, oldRefDict))
+        refRemoved = [k for k in oldRefDict if k not in self.refDict]
+        return dict(base=base, index=list(map(_jsonable, index)), columns=list(map(_jsonable, columns)),
+                    changes=changes, refDict=dict(set=refSet, removed=refRemoved))
 
 
     def copy(self, path):
@@ -305,35 +943,395 @@ class SciCatalog:
         Copy the catalog to a new path on the disk and return the copied object.
         """
 
-        new = SciCatalog(path, self.values, self.errpos, self.errneg, self.refs, self.refDict)
+        new = SciCatalog(path, self.values, self.errpos, self.errneg, self.refs, self.refDict, format=self.format)
         new.save()
 
         return new
 
 
+    @classmethod
+    def merge(cls, path, catalogs, onConflict='first', rtol=1e-05, atol=1e-08, format=None, writeReport=True):
+        """
+        Merge several catalogs into a new one at path. The rows, columns, and reference dictionaries of the catalogs
+        are outer-aligned and each item is picked from the catalogs that have it all at once with array operations.
+        The new catalog is written once, and a report of the items the catalogs disagree on is written alongside its
+        tables as merge_conflicts.csv (unless writeReport is False, which saves time when there are many conflicts).
+
+        Parameters
+        ----------
+        path : str
+            Path of the new catalog.
+        catalogs : list
+            SciCatalogs, or paths of catalogs to open read only, in order of precedence.
+        onConflict : str
+            How to pick among the catalogs that have an item (a value, error, or reference) in the same row and
+            column:
+                'first' : the earliest catalog in the list wins
+                'smallestError' : the item with the smallest error (the larger of its two errors) wins, with items
+                    that have no error losing to those that do and ties going to the earliest catalog
+                'newest' : the catalog most recently saved to the disk wins
+            Reference keys defined differently by several catalogs take the definition from the catalog that wins
+            under 'first' or 'newest' (the earliest catalog for 'smallestError').
+        rtol, atol : float
+            Tolerances within which numerical items agree, as for numpy.isclose.
+        format : str
+            Storage format of the new catalog. Defaults to that of the first catalog.
+
+        Returns
+        -------
+        catalog : SciCatalog
+            The merged catalog, open for editing.
+        report : dict
+            sources : DataFrame of the name of the catalog each item was taken from (None where no catalog has one)
+            conflicts : DataFrame with columns index, col, catalog, value, errpos, errneg, ref, and chosen listing the
+                item of every catalog that has one in each row and column where they disagree
+            refDict : dictionary of the definitions (keyed by catalog name) of each reference key the catalogs define
+                differently
+        """
+        if onConflict not in ['first', 'smallestError', 'newest']:
+            raise ValueError("onConflict must be 'first', 'smallestError', or 'newest'.")
+        catalogs = [cls(c, readOnly=True, silent=True) if isinstance(c, str) else c for c in catalogs]
+        if not catalogs:
+            raise ValueError('There are no catalogs to merge.')
+        if format is None:
+            format = catalogs[0].format
+        names = [cat.name for cat in catalogs]
+        if len(set(names)) < len(names):
+            names = ['{}[{}]'.format(name, k) for k, name in enumerate(names)]
+
+        index, columns = catalogs[0].values.index, catalogs[0].values.columns
+        for cat in catalogs[1:]:
+            index = index.union(cat.values.index, sort=False)
+            columns = columns.union(cat.values.columns, sort=False)
+
+        # rank the catalogs best first, so that ties go to the better ranked catalog
+        if onConflict == 'newest':
+            ranks = sorted(range(len(catalogs)), key=lambda k: -catalogs[k]._savedTime())
+            catalogs, names = [catalogs[k] for k in ranks], [names[k] for k in ranks]
+
+        # stack each table of every catalog into a (catalog, row, column) array
+        stacks = []
+        for i, null in enumerate(cls.nullValues):
+            tbls = [_plain(cat._table(i)).reindex(index=index, columns=columns, fill_value=null) for cat in catalogs]
+            numeric = all(dtype.kind in 'biuf' for tbl in tbls for dtype in tbl.dtypes)
+            stacks.append(np.stack([tbl.to_numpy(dtype=float if numeric else object) for tbl in tbls]))
+        values, errpos, errneg, refs = stacks
+        present = ~pd.isnull(values) | ~pd.isnull(errpos) | ~pd.isnull(errneg) | ~(pd.isnull(refs) | (refs == 'none'))
+
+        if onConflict == 'smallestError':
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                err = np.fmax(errpos.astype(float), errneg.astype(float))
+            err[np.isnan(err)] = np.finfo(float).max
+            choice = np.argmin(np.where(present, err, np.inf), axis=0)
+        else:
+            choice = np.argmax(present, axis=0)
+        chosen = [np.take_along_axis(stack, choice[None], axis=0)[0] for stack in stacks]
+
+        # a conflict is an item of some catalog that differs from the one chosen
+        differs = np.zeros(present.shape, bool)
+        for stack, picked in zip(stacks, chosen):
+            for k in range(len(catalogs)):
+                differs[k] |= _unequalArrays(stack[k], picked, rtol, atol)
+        conflicted = (present & differs).any(axis=0)
+
+        rows, cols = np.nonzero(conflicted)
+        ks = np.repeat(np.arange(len(catalogs))[:, None], len(rows), axis=1)
+        has = present[:, rows, cols]
+        ks, rows, cols = ks[has], np.tile(rows, (len(catalogs), 1))[has], np.tile(cols, (len(catalogs), 1))[has]
+        order = np.lexsort((ks, cols, rows))
+        ks, rows, cols = ks[order], rows[order], cols[order]
+        conflicts = pd.DataFrame(dict(index=index[rows], col=columns[cols], catalog=np.array(names, object)[ks],
+                                      value=values[ks, rows, cols], errpos=errpos[ks, rows, cols],
+                                      errneg=errneg[ks, rows, cols], ref=refs[ks, rows, cols],
+                                      chosen=choice[rows, cols] == ks))
+
+        sources = np.array(names, object)[choice]
+        sources[~present.any(axis=0)] = None
+        sources = pd.DataFrame(sources, index=index, columns=columns)
+
+        # reference entries, going from the worst ranked catalog to the best so that the best has the last word
+        refDict = refdict.RefDict(catalogs[-1].refDict)
+        clashes = set()
+        for cat in catalogs[-2::-1]:
+            for key in refdict.changedKeys(cat.refDict, refDict):
+                if key in refDict:
+                    clashes.add(key)
+                refDict[key] = cat.refDict[key]
+        refConflicts = dict((key, dict((name, cat.refDict[key]) for cat, name in zip(catalogs, names)
+                                       if key in cat.refDict))
+                            for key in clashes)
+
+        tables = [pd.DataFrame(ary, index=index, columns=columns) for ary in chosen]
+        tables[:3] = [tbl if tbl.dtypes.map(lambda d: d.kind == 'f').all() else tbl.infer_objects()
+                      for tbl in tables[:3]]
+        merged = cls(path, *tables, refDict=refDict, format=format)
+        if writeReport:
+            conflicts.to_csv(os.path.join(path, cls.mergeReportFile), index=False)
+        return merged, dict(sources=sources, conflicts=conflicts, refDict=refConflicts)
+
+
+    def _savedTime(self):
+        """
+        Time at which the catalog's files on the disk were last changed.
+        """
+        paths = self.paths + [self.journalPath, os.path.join(self.path, self.manifestFile)]
+        return max(os.path.getmtime(p) for p in paths if os.path.exists(p))
+
+
     def save(self):
         """
-        Write the SciCatalog to the disk (creating a set of files in self.path). This is useful if you have been
-        tinkering with the table entries manually (i.e. via attributes rather than with the object methods).
+        Write the SciCatalog to the disk (creating a set of files in self.path) and empty the journal. This is useful
+        if you have been tinkering with the table entries manually (i.e. via attributes rather than with the object
+        methods).
+
+        Saves are atomic. The files are written to a staging directory and flushed to the disk, then the staged
+        generation is committed by atomically replacing the manifest before the files are moved into place. A save
+        interrupted after the commit is finished the next time the catalog is opened for editing, one interrupted
+        before it leaves the previous generation untouched.
         """
 
         if not self.readOnly:
-            # save tables
-            for tbl, path in zip(self.tables, self.paths):
-                tbl.to_csv(path)
-
-            self._saveRefDict()
+            self._checkLock()
+            self._backupIfPending()
+            with self._filesLocked(shared=False):
+                self._saveGeneration()
+            # everything in memory, including any direct edits to the tables, is now on the disk
+            self._journaledHashes = [None if tbl is None else _columnHashes(tbl) for tbl in self._tables]
+            self._journaledRefDict = refdict.RefDict(self.refDict)
+            self._loadedState = self._diskState()
         else:
             raise IOError('Cannot save catalog because it was opened in read only mode.')
 
 
+    def _saveGeneration(self):
+        """
+        Write the next generation of the catalog files.
+        """
+        generation = self._generation + 1
+        staged = '{}{}'.format(self.stagingPrefix, generation)
+        stageDir = os.path.join(self.path, staged)
+        if os.path.exists(stageDir):
+            shutil.rmtree(stageDir)
+        os.mkdir(stageDir)
+
+        # save tables
+        for tbl, path in zip(self.tables, self._tablepaths(stageDir, self.fileSuffix)):
+            self.storage.write(_plain(tbl), path)
+
+        self._saveRefDict(os.path.join(stageDir, self.refDictFile) + '.' + self.refFileSuffix)
+
+        for name in os.listdir(stageDir):
+            _fsync(os.path.join(stageDir, name))
+        _fsync(stageDir)
+
+        # commit
+        self._writeManifest(generation, staged)
+        self._generation = generation
+        self._install(staged)
+
+        # everything in the journal (and anything waiting to go in it) is now in the table files
+        self._pendingOps = []
+        self._journalLength = 0
+        if os.path.exists(self.journalPath):
+            os.remove(self.journalPath)
+
+
+    @property
+    def generation(self):
+        """
+        Number of times the catalog files have been saved, as recorded in the manifest when the catalog was loaded or
+        last saved.
+        """
+        return self._generation
+
+
+    def _install(self, staged):
+        """
+        Move the files of the committed generation in the staging directory staged into place, then drop the staging
+        directory from the manifest and the disk.
+        """
+        stageDir = os.path.join(self.path, staged)
+        for name in os.listdir(stageDir):
+            os.replace(os.path.join(stageDir, name), os.path.join(self.path, name))
+        _fsync(self.path)
+        self._writeManifest(self._generation, None)
+        os.rmdir(stageDir)
+        self.paths = self._tablepaths(self.path, self.fileSuffix)
+        self.refDictPath = os.path.join(self.path, self.refDictFile) + '.' + self.refFileSuffix
+
+        # the reference dictionary of catalogs saved before the JSON lines format is now superseded
+        legacyPath = os.path.join(self.path, self.refDictFile) + '.' + self.legacyRefFileSuffix
+        if os.path.exists(legacyPath):
+            os.remove(legacyPath)
+
+
+    def _clearStaging(self):
+        """
+        Delete staging directories left by saves that were interrupted before they were committed.
+        """
+        for name in os.listdir(self.path):
+            if name.startswith(self.stagingPrefix):
+                shutil.rmtree(os.path.join(self.path, name))
+
+
+    @classmethod
+    def _readManifest(cls, path):
+        """
+        Read the manifest of the catalog at path, which records the generation of the catalog files and the staging
+        directory of a committed generation whose files have not all been moved into place yet. Catalogs that have
+        never been saved with a manifest are generation 0.
+        """
+        manifestPath = os.path.join(path, cls.manifestFile)
+        if not os.path.exists(manifestPath):
+            return dict(generation=0, staged=None)
+        with open(manifestPath) as f:
+            return json.load(f)
+
+
+    def _writeManifest(self, generation, staged):
+        """
+        Atomically replace the manifest.
+        """
+        manifestPath = os.path.join(self.path, self.manifestFile)
+        tmpPath = manifestPath + '.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump(dict(generation=generation, staged=staged), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpPath, manifestPath)
+        _fsync(self.path)
+
+
+    def _diskState(self):
+        """
+        Generation of the catalog files and size of the journal on the disk.
+        """
+        journalSize = os.path.getsize(self.journalPath) if os.path.exists(self.journalPath) else 0
+        return self._readManifest(self.path)['generation'], journalSize
+
+
+    def compact(self):
+        """
+        Fold the edits recorded in the journal into the table files. This happens automatically once the journal
+        holds journalLimit edits.
+
+        Edits made with the catalog methods are not written to the table files right away. Instead, each is appended
+        to a journal file in the catalog directory (and flushed all the way to the disk) so that an edit takes the
+        same time no matter how large the catalog is. The journal is replayed on top of the table files whenever the
+        catalog is opened.
+        """
+        if self._journalLength > 0:
+            self.save()
+
+
     def checkRef(self, refkey):
         """
-        Check whether there is an entry in the reference dictionary for refKey. Issue warning if not.
+        Check whether there is an entry in the reference dictionary for refKey (or each of the comma-separated keys
+        in it). Issue warning if not.
+        """
+        return self.checkRefs([refkey])
+
+
+    def checkRefs(self, refkeys=None):
+        """
+        Check a whole array of reference entries at once (by default, the entire refs table). Entries can hold several
+        comma-separated keys. Issue a single warning listing any keys that are not in the reference dictionary.
+
+        Returns
+        -------
+        A dictionary of the number of entries citing each unknown key.
+        """
+        entries = self.refs.to_numpy(dtype=object) if refkeys is None else np.asarray(refkeys, dtype=object)
+        counts = pd.Series(entries.ravel()).value_counts()
+        unknown = {}
+        for entry, n in counts.items():
+            for key in _splitRefs(entry):
+                if key not in self.refDict:
+                    unknown[key] = unknown.get(key, 0) + n
+        if unknown:
+            warn("The reference keys {} are not in the reference dictionary for this catalog. "
+                 "You can add them with the `addRefEntry` method.".format(', '.join(sorted(map(str, unknown)))))
+        return unknown
+
+
+    def citing(self, refkey):
+        """
+        Return a list of the (index, col) locations of the items citing the reference refkey.
+
+        The lookup uses an index of the references that is built the first time it is needed and then kept up to date
+        by the catalog methods. Edits made directly to the refs table aren't tracked, so assign the table back
+        (cat.refs = cat.refs) after making any.
+        """
+        return sorted(self._citations().get(refkey, ()), key=str)
+
+
+    def unusedRefs(self):
+        """
+        Return a list of the keys in the reference dictionary that no item cites.
+        """
+        citations = self._citations()
+        return sorted(key for key in self.refDict if not citations.get(key))
+
+
+    def removeRefEntries(self, refkeys):
+        """
+        Remove entries from the reference dictionary in place and save to disk. Raises a ValueError, removing
+        nothing, if any of the keys is still cited.
+
+        Example
+        -------
+        >>> cat.removeRefEntries(cat.unusedRefs())
+        """
+        refkeys = list(refkeys)
+        cited = [key for key in refkeys if self._citations().get(key)]
+        if cited:
+            raise ValueError('The reference keys {} are still cited in the catalog.'.format(', '.join(map(str, cited))))
+        for key in refkeys:
+            del self.refDict[key]
+            self._journaledRefDict.pop(key, None)
+
+        self._sync(['removeRefEntries', refkeys])
+
+
+    def _citations(self):
+        """
+        The reverse index of the references, a dictionary of the set of (index, col) locations citing each key.
+        """
+        if self._refIndex is None:
+            # group the items by entry, so that each distinct entry only has to be split once
+            refs = self.refs
+            codes, entries = pd.factorize(refs.to_numpy(dtype=object).ravel())
+            rows = np.repeat(refs.index.to_numpy(dtype=object), refs.shape[1])
+            cols = np.tile(refs.columns.to_numpy(dtype=object), refs.shape[0])
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(entries) + 1))
+            self._refIndex = {}
+            for k, entry in enumerate(entries):
+                keys = _splitRefs(entry)
+                if keys:
+                    sel = order[bounds[k]:bounds[k+1]]
+                    cells = set(zip(rows[sel], cols[sel]))
+                    for key in keys:
+                        self._refIndex.setdefault(key, set()).update(cells)
+        return self._refIndex
+
+
+    def _indexRefs(self, rows, cols, old, new):
         """
-        if refkey not in ['none', None] and refkey not in self.refDict:
-            warn("The reference key {} is not in the reference dictionary for this catalog. "
-                 "You can add it with the `addRefEntry` method.".format(refkey))
+        Update the reverse index of the references for the items in the given rows and columns changing from the
+        old to the new 2D arrays of entries.
+        """
+        if self._refIndex is None:
+            return
+        for i, row in enumerate(rows):
+            for j, col in enumerate(cols):
+                if old[i][j] == new[i][j]:
+                    continue
+                for key in _splitRefs(old[i][j]):
+                    self._refIndex.get(key, set()).discard((row, col))
+                for key in _splitRefs(new[i][j]):
+                    self._refIndex.setdefault(key, set()).add((row, col))
 
 
     def addRefEntry(self, refkey, definition):
@@ -361,9 +1359,9 @@ class SciCatalog:
                  "".format(rk=refkey, old=self.refDict[refkey], new=definition))
 
         self.refDict[refkey] = definition
+        self._journaledRefDict[refkey] = definition
 
-        if not self.readOnly:
-            self._saveRefDict()
+        self._sync(['addRefEntry', refkey, definition])
 
 
     def addCol(self, colname, dtype=None):
@@ -379,11 +1377,116 @@ class SciCatalog:
         -------
         None
         """
-        index = self.values.index
-        for tbl, val, path in zip(self.tables, self.nullValues, self.paths):
-            dt = str if tbl is self.refs else dtype
-            tbl[colname] = pd.Series(data=[val]*len(self), index=index, dtype=dt)
-            tbl.to_csv(path)
+        self.addCols([colname], dtype)
+
+
+    def addCols(self, colnames, dtypes=None, values=None, errpos=None, errneg=None, refs=None):
+        """
+        Adds several columns to the catalog in place at once and saves to disk once.
+
+        Parameters
+        ----------
+        colnames : list
+            Names for the new columns.
+        dtypes : dtype or list
+            Data type of the new columns of the values and error tables, either one for all of them or a list with
+            one for each. Default is to leave them as floats.
+        values, errpos, errneg, refs : DataFrame or 2D array-like
+            Optional data to fill the new columns with, as for the update method. Array-likes must have a row for
+            every row of the catalog and a column for each new column. The new columns are initialized with null
+            values otherwise.
+
+        Returns
+        -------
+        None
+        """
+        colnames = list(colnames)
+        self._checkNew(colnames, self.values.columns, 'column')
+        if dtypes is None or isinstance(dtypes, (str, type, np.dtype)):
+            dtypes = [dtypes]*len(colnames)
+
+        columns = self.values.columns.append(pd.Index(colnames))
+        tables = [tbl.reindex(columns=columns, fill_value=val) for tbl, val in zip(self.tables, self.nullValues)]
+        for tbl in tables[:3]:
+            for colname, dtype in zip(colnames, dtypes):
+                if dtype is not None:
+                    tbl[colname] = tbl[colname].astype(dtype)
+        tables[3][colnames] = tables[3][colnames].astype(str)
+
+        with self.batch():
+            with self._tracking(None, colnames):
+                self._setTables(tables)
+                self._tighten(colnames)
+            self._sync(['addCols', colnames, [None if d is None else pd.api.types.pandas_dtype(d).name
+                                              for d in dtypes]])
+            if any(d is not None for d in [values, errpos, errneg, refs]):
+                self.update(values, errpos, errneg, refs, index=self.values.index, columns=colnames)
+
+
+    def derive(self, newcol, func, inputs, method='linear', nsamples=1000, chunkSize=None, seed=None, refkey=None):
+        """
+        Compute a new column from existing ones, propagating their asymmetric errors, and add it to the catalog (or
+        overwrite it, if it exists) in a single write along with a reference entry describing how it was derived.
+
+        Parameters
+        ----------
+        newcol : str
+            Name of the derived column.
+        func : function
+            Function of the input columns, called with one float array per input and evaluated on whole columns at
+            once, e.g. lambda R, T: 4*np.pi*sigma*R**2*T**4.
+        inputs : list
+            Names of the columns to pass to func, in order.
+        method : 'linear'|'montecarlo'
+            How to propagate the errors (see the propagate module). 'linear' shifts each input by its errors and adds
+            the changes in quadrature. 'montecarlo' samples the inputs from split normal distributions.
+        nsamples : int
+            Number of Monte Carlo samples per item.
+        chunkSize : int
+            Number of rows to sample at once with the Monte Carlo method. Default is to bound the memory used by
+            the samples to propagate.chunkBytes.
+        seed : int
+            Seed for the Monte Carlo random number generator.
+        refkey : str
+            Reference key to give the derived items. Default is 'derived:' followed by newcol.
+
+        Returns
+        -------
+        None
+        """
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        if not inputs:
+            raise ValueError('At least one input column is needed.')
+        missing = [c for c in inputs if c not in self.values.columns]
+        if missing:
+            raise KeyError('Columns {} are not in the catalog.'.format(missing))
+        data = [[pd.to_numeric(tbl[c], errors='coerce').to_numpy(dtype=float) for c in inputs]
+                for tbl in self.tables[:3]]
+        if method == 'linear':
+            value, errpos, errneg = propagate.linear(func, *data)
+        elif method == 'montecarlo':
+            value, errpos, errneg = propagate.montecarlo(func, *data, nsamples=nsamples, chunkSize=chunkSize,
+                                                        seed=seed)
+        else:
+            raise ValueError("method must be 'linear' or 'montecarlo'.")
+
+        if refkey is None:
+            refkey = 'derived:' + str(newcol).replace(',', ';')
+        name = getattr(func, '__name__', '<lambda>')
+        definition = 'Derived from {}{} with {} error propagation{}.'.format(
+            ', '.join(map(str, inputs)), '' if name == '<lambda>' else ' by ' + name, method,
+            ' ({} samples)'.format(nsamples) if method == 'montecarlo' else '')
+        good = ~np.isnan(value)
+        ref = np.where(good, refkey, self.nullValues[3]).astype(object)
+
+        DF = lambda data: pd.DataFrame({newcol: data}, index=self.values.index)
+        with self.batch():
+            if self.refDict.get(refkey) != definition:
+                self.addRefEntry(refkey, definition)
+            if newcol in self.values.columns:
+                self.update(DF(value), DF(errpos), DF(errneg), DF(ref))
+            else:
+                self.addCols([newcol], values=DF(value), errpos=DF(errpos), errneg=DF(errneg), refs=DF(ref))
 
 
     def addRow(self, index):
@@ -399,10 +1502,81 @@ class SciCatalog:
         -------
         None
         """
-        n = self.values.shape[1]
-        for tbl, val, path in zip(self.tables, self.nullValues, self.paths):
-            tbl.loc[index] = [val]*n
-            tbl.to_csv(path)
+        self.addRows([index])
+
+
+    def addRows(self, indices, values=None, errpos=None, errneg=None, refs=None):
+        """
+        Adds several rows to the catalog in place at once and saves to disk once. This is much faster than adding
+        the rows one at a time with addRow.
+
+        Parameters
+        ----------
+        indices : list
+            Indices for the new rows.
+        values, errpos, errneg, refs : DataFrame or 2D array-like
+            Optional data to fill the new rows with, as for the update method. Array-likes must have a row for each
+            new row and a column for every column of the catalog. The new rows are initialized with null values
+            otherwise.
+
+        Returns
+        -------
+        None
+        """
+        indices = list(indices)
+        self._checkNew(indices, self.values.index, 'row')
+
+        index = self.values.index.append(pd.Index(indices))
+        tables = [tbl.reindex(index=index, fill_value=val) for tbl, val in zip(self.tables, self.nullValues)]
+
+        with self.batch():
+            with self._tracking(indices, None):
+                self._setTables(tables)
+            self._sync(['addRows', indices])
+            if any(d is not None for d in [values, errpos, errneg, refs]):
+                self.update(values, errpos, errneg, refs, index=indices, columns=self.colnames)
+
+
+    @staticmethod
+    def _checkNew(labels, existing, kind):
+        """
+        Raise an error if any of the labels are already in use or repeated.
+        """
+        dupes = [lbl for lbl in labels if lbl in existing]
+        if dupes or len(set(labels)) < len(labels):
+            raise ValueError('Cannot add {kind}s {d} because they are repeated or there are already {kind}s with '
+                             'those names in the catalog.'.format(kind=kind, d=dupes or labels))
+
+
+    @property
+    def tables(self):
+        """
+        List of the values, errpos, errneg, and refs tables, loading any that haven't been read from the disk yet.
+        """
+        return [self._table(i) for i in range(len(self._tables))]
+
+    values = property(lambda self: self._table(0), lambda self, tbl: self._setTable(0, tbl),
+                      doc="DataFrame of the values.")
+    errpos = property(lambda self: self._table(1), lambda self, tbl: self._setTable(1, tbl),
+                      doc="DataFrame of the positive errors.")
+    errneg = property(lambda self: self._table(2), lambda self, tbl: self._setTable(2, tbl),
+                      doc="DataFrame of the negative errors.")
+    refs = property(lambda self: self._table(3), lambda self, tbl: self._setTable(3, tbl),
+                    doc="DataFrame of the reference keys.")
+
+    @property
+    def format(self):
+        """
+        Name of the storage format of the table files.
+        """
+        return self.storage.format
+
+    @property
+    def fileSuffix(self):
+        """
+        File suffix of the table files.
+        """
+        return self.storage.suffix
 
     @property
     def colnames(self):
@@ -420,19 +1594,339 @@ class SciCatalog:
 
 
     def renameCol(self, oldname, newname):
-        for tbl in self.tables:
-            tbl.rename(columns={oldname : newname}, inplace=True)
+        with self._tracking(None, [oldname, newname]):
+            for tbl in self.tables:
+                tbl.rename(columns={oldname : newname}, inplace=True)
+        self._refIndex = None
 
-        if not self.readOnly:
-            self.save()
+        self._sync(['renameCol', oldname, newname])
 
 
     def renameRow(self, oldname, newname):
+        with self._tracking([oldname, newname], None):
+            for tbl in self.tables:
+                tbl.rename(index={oldname : newname}, inplace=True)
+        self._refIndex = None
+
+        self._sync(['renameRow', oldname, newname])
+
+
+    def isModified(self, deep=True):
+        """
+        Check whether the catalog has been changed since it was opened (or created) without touching the disk.
+
+        Edits made with the catalog methods are counted as they happen, so those are detected immediately. Edits made
+        directly to the table attributes or the reference dictionary are detected by comparing hashes of the tables'
+        contents to those taken when they were loaded, which is skipped if deep is False.
+        """
+        if self._modCount > 0:
+            return True
+        if not deep:
+            return False
+        return self._isModified([None if tbl is None else _columnHashes(tbl) for tbl in self._tables])
+
+
+    def _isModified(self, hashes):
+        """
+        Like isModified, given the current hashes of the tables' columns.
+        """
+        if self._modCount > 0:
+            return True
+        for new, old in zip(hashes, self._hashes):
+            if new is not None and list(new.items()) != list(old.items()):
+                return True
+        return self.refDict != self._refDictAtOpen
+
+
+    def _backupIfPending(self):
+        """
+        Make the backup put off when the catalog was loaded lazily, before the first edit is written to the disk. It is
+        made from the files on the disk, which still hold the catalog as it was opened, so that tables that haven't
+        been read from the disk needn't be.
+        """
+        if not self._backupPending:
+            return
+        self._backupPending = False
+        self._lastBackup = SciCatalog(self.path, readOnly=True, silent=True, lazy=True).backup()
+
+
+    def _hasUnjournaledEdits(self, hashes):
+        """
+        Check whether the tables or reference dictionary have been edited directly rather than with the catalog methods,
+        so that the edits aren't in the journal, by comparing the current hashes of the tables' columns to those of the
+        tables as journaled (see _tracking). Nothing is read from the disk.
+        """
+        for new, journaled in zip(hashes, self._journaledHashes):
+            if new is not None and new != journaled:
+                return True
+        return self.refDict != self._journaledRefDict
+
+
+    def _rememberHashes(self, i):
+        """
+        Take the hashes of the columns of table i just after it is loaded, which are used to find edits made to it
+        since (with isModified) and edits that haven't been journaled (with _hasUnjournaledEdits).
+        """
+        self._hashes[i] = _columnHashes(self._tables[i])
+        self._journaledHashes[i] = dict(self._hashes[i])
+
+
+    @contextmanager
+    def _tracking(self, rows=None, cols=None, tables=None):
+        """
+        Context manager keeping the hashes of the journaled state of the tables up to date across an edit made with the
+        catalog methods that changes only the items in the given rows and columns (None meaning all of them) of the
+        tables with the given positions in the list of tables (None meaning all of them), including rows and columns
+        that the edit adds or removes. Only those items are hashed, so direct edits made elsewhere (or earlier to the
+        same items) still show up as differences.
+        """
+        if self._replaying:
+            yield
+            return
+        tables = range(len(self._tables)) if tables is None else tables
+        labels = {}
+        before = dict((i, self._regionHashes(i, rows, cols, labels)) for i in tables)
+        yield
+        labels = {}
+        for i, old in before.items():
+            hashes = self._journaledHashes[i]
+            if hashes is None or old is None:
+                continue
+            new = self._regionHashes(i, rows, cols, labels)
+            for c in set(old) | set(new):
+                if c not in new:
+                    hashes.pop(c, None)
+                    continue
+                newDtype, newSum = new[c]
+                oldDtype, oldSum = old.get(c, (newDtype, 0))
+                delta = newSum - oldSum
+                if oldDtype != newDtype and rows is not None:
+                    # the edit changed the dtype of the column, which changes the hashes of the rest of its items too
+                    column = _hashableColumn(self._tables[i][c])
+                    rest = column[~column.index.isin(rows)]
+                    labels = _hashLabels(rest.index)
+                    try:
+                        delta += _hashSum(rest, labels) - _hashSum(rest.astype(oldDtype), labels)
+                    except (TypeError, ValueError):
+                        pass
+                hashes[c] = (hashes.get(c, 0) + delta) % 2**64
+
+
+    def _regionHashes(self, i, rows, cols, labels):
+        """
+        Dictionary of the dtype and the sum of the hashes of the items (see _columnHashes) in the given rows of each of
+        the given columns of table i that are in the table, or None if the table's hashes aren't being kept. labels is
+        a dictionary for reusing the positions and hashes of the rows between tables with the same index.
+        """
+        if self._journaledHashes[i] is None:
+            return None
+        tbl = self._tables[i]
+        if id(tbl.index) not in labels:
+            positions = None
+            if rows is not None:
+                positions = tbl.index.get_indexer(pd.Index(list(rows)))
+                positions = positions[positions >= 0]
+            labels[id(tbl.index)] = positions, _hashLabels(tbl.index if positions is None else tbl.index[positions])
+        positions, labels = labels[id(tbl.index)]
+        region = {}
+        for c in (tbl.columns if cols is None else [c for c in cols if c in tbl.columns]):
+            column = _hashableColumn(tbl[c])
+            region[c] = column.dtype, _hashSum(column if positions is None else column.iloc[positions], labels)
+        return region
+
+
+    def _encodeOp(self, op):
+        """
+        Serialize an edit for the journal, raising an error if any of its arguments can't be written to json. Returns
+        None in read only mode or while replaying the journal, when edits aren't recorded.
+        """
+        if self._replaying or self.readOnly:
+            return None
+        return json.dumps(op, default=_jsonable)
+
+
+    def _sync(self, op):
+        """
+        Record an edit in the journal, where op is a list of the name of the method that made the edit followed by the
+        arguments that will repeat it, or that list already serialized by _encodeOp. Does nothing in read only mode or
+        while replaying the journal. Within a batch block, the write is deferred until the block exits.
+        """
+        if self._replaying:
+            return
+        self._modCount += 1
+        if self.readOnly:
+            return
+        self._checkLock()
+        self._pendingOps.append(op if isinstance(op, str) else self._encodeOp(op))
+        if self._batchDepth == 0:
+            self._flushJournal()
+
+
+    def _flushJournal(self):
+        """
+        Append the edits waiting to be written to the journal, making sure they reach the disk before returning, and
+        compact the catalog if the journal has grown past journalLimit.
+        """
+        ops, self._pendingOps = self._pendingOps, []
+        if not ops:
+            return
+        lines = ''.join(op + '\n' for op in ops)
+        if not os.path.exists(self.journalPath) or os.path.getsize(self.journalPath) == 0:
+            # tie the journal to the generation of table files it applies to
+            lines = json.dumps(dict(generation=self._generation)) + '\n' + lines
+        self._backupIfPending()
+        with self._filesLocked(shared=False):
+            with open(self.journalPath, 'a') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        self._journalLength += len(ops)
+        self._loadedState = self._diskState()
+        if self._lock is not None:
+            self._lock.renew()
+        if self._journalLength >= self.journalLimit:
+            self.compact()
+
+
+    def _readJournal(self):
+        """
+        Read the list of edits in the journal. An incomplete last line (left by a crash while it was being written) is
+        dropped, and cut from the file if the catalog is open for editing so that later edits aren't appended to it.
+        A journal left over from an earlier generation of the table files (by a crash just after a save) is ignored.
+        """
+        if not os.path.exists(self.journalPath):
+            return []
+        ops, end = _parseJournal(self.journalPath, self._generation)
+        if ops is None:
+            if not self.readOnly:
+                os.remove(self.journalPath)
+            return []
+        if not self.readOnly and end < os.path.getsize(self.journalPath):
+            warn('Dropping an incomplete edit from the end of the journal of {}.'.format(self.name))
+            with open(self.journalPath, 'r+b') as f:
+                f.truncate(end)
+        self._journalLength = len(ops)
+        return ops
+
+
+    def _replay(self, ops):
+        """
+        Repeat the edits read from the journal.
+        """
+        self._replaying = True
+        try:
+            with warnings.catch_warnings():
+                # the warnings were already issued when the edits were first made
+                warnings.simplefilter('ignore')
+                for op in ops:
+                    name, args = op[0], op[1:]
+                    if name not in self._journalOps:
+                        raise IOError('Unrecognized edit {} in the journal of {}.'.format(name, self.name))
+                    if name == 'update':
+                        args = [None if b is None else _fromSplitDict(b) for b in args[:4]] + args[4:]
+                    getattr(self, name)(*args)
+        finally:
+            self._replaying = False
+
+
+    def memoryUsage(self):
+        """
+        Return a Series of the bytes of memory used by each table (by key), counting only tables that have been
+        loaded.
+        """
+        usage = [0 if tbl is None else int(tbl.memory_usage(deep=True).sum()) for tbl in self._tables]
+        return pd.Series(usage, index=self.keys)
+
+
+    def _shrink(self, i, tbl):
+        """
+        Return table i in the compact form chosen with the lowMemory and float32 options.
+        """
+        if not (self.lowMemory or self.float32):
+            return tbl
+        data = dict((c, self._shrinkColumn(i, tbl[c])) for c in tbl.columns)
+        return pd.DataFrame(data, index=tbl.index, columns=tbl.columns)
+
+
+    def _shrinkColumn(self, i, column):
+        key = self.keys[i]
+        if isinstance(column.dtype, (pd.SparseDtype, pd.CategoricalDtype)):
+            return column
+        if key == 'ref':
+            if self.lowMemory:
+                categories = set(self.refDict) | {'none'} | set(column.dropna())
+                column = column.astype(pd.CategoricalDtype(sorted(categories, key=str)))
+            return column
+        if column.dtype.kind != 'f':
+            return column
+        if self.float32:
+            column = column.astype(np.float32)
+        if self.lowMemory and key != 'value' and column.notnull().mean() < self.sparseBelow:
+            column = column.astype(pd.SparseDtype(column.dtype, np.nan))
+        return column
+
+
+    def _loosen(self, cols):
+        """
+        Convert the given columns of compact tables back to plain dtypes (with single precision floats widened to
+        double precision) so that items can be assigned to them.
+        """
+        if not (self.lowMemory or self.float32):
+            return
         for tbl in self.tables:
-            tbl.rename(index={oldname : newname}, inplace=True)
+            for c in cols:
+                if c in tbl.columns:
+                    if isinstance(tbl[c].dtype, pd.SparseDtype):
+                        tbl[c] = tbl[c].sparse.to_dense()
+                    elif isinstance(tbl[c].dtype, pd.CategoricalDtype):
+                        tbl[c] = tbl[c].astype(object)
+                    if tbl[c].dtype == np.float32:
+                        tbl[c] = tbl[c].astype(np.float64)
 
-        if not self.readOnly:
-            self.save()
+
+    def _tighten(self, cols):
+        """
+        Undo _loosen, returning the given columns to their compact form.
+        """
+        if not (self.lowMemory or self.float32):
+            return
+        for i, tbl in enumerate(self.tables):
+            for c in cols:
+                if c in tbl.columns:
+                    tbl[c] = self._shrinkColumn(i, tbl[c])
+
+
+    def _setTables(self, tables):
+        """
+        Replace the list of tables and the attributes pointing to each.
+        """
+        self._tables = list(tables)
+
+
+    def _setTable(self, i, tbl):
+        self._tables[i] = tbl
+        if self.keys[i] == 'ref':
+            self._refIndex = None
+
+
+    def _table(self, i):
+        """
+        Return table i, reading it from the disk if it hasn't been yet.
+        """
+        if self._tables[i] is None:
+            ref = self.keys[i] == 'ref'
+            tbl = self.storage.read(self.paths[i], columns=self._columns, rows=self._rows, ref=ref)
+            self._tables[i] = self._shrink(i, tbl)
+            self._rememberHashes(i)
+        return self._tables[i]
+
+
+    @classmethod
+    def _readRefDict(cls, path):
+        """
+        Read a reference dictionary from the disk.
+        """
+        return refdict.read(path)
 
 
     def _saveRefDict(self, path=None):
@@ -443,15 +1937,18 @@ class SciCatalog:
         # save reference key
         if path is None:
             path = self.refDictPath
-        with open(path, 'w') as f:
-            for key, ref in self.refDict.items():
-                f.write('{} : {}\n'.format(key, ref))
+        refdict.write(self.refDict, path)
 
-    @classmethod
-    def _listpaths(cls, path):
-        names = os.listdir(path)
-        return [os.path.join(path, name) for name in names]
 
+    @classmethod
+    def _refDictPath(cls, path):
+        """
+        Path of the reference dictionary file in the directory at path, which is in the original 'key : definition'
+        format for catalogs that haven't been saved since the JSON lines format was introduced.
+        """
+        newPath = os.path.join(path, cls.refDictFile) + '.' + cls.refFileSuffix
+        oldPath = os.path.join(path, cls.refDictFile) + '.' + cls.legacyRefFileSuffix
+        return oldPath if os.path.exists(oldPath) and not os.path.exists(newPath) else newPath
 
     @classmethod
     def _fillDF(cls, val, columns, index):
@@ -463,8 +1960,242 @@ class SciCatalog:
 
 
     @classmethod
-    def _tablepaths(cls, path):
-        return [os.path.join(path, name) + '.' + cls.fileSuffix for name in cls.tableFiles]
+    def _tablepaths(cls, path, suffix):
+        return [os.path.join(path, name) + '.' + suffix for name in cls.tableFiles]
+
+
+def _unequalItems(tbl0, tbl1, rtol, atol):
+    """
+    Return a boolean array flagging the items that differ between two tables with the same labels. Numerical columns
+    are compared in one numpy.isclose call, the rest by equality. Null items are equivalent.
+    """
+    numeric = np.array([tbl0[c].dtype.kind in 'biuf' and tbl1[c].dtype.kind in 'biuf' for c in tbl0.columns],
+                       dtype=bool)
+    unequal = np.zeros(tbl0.shape, dtype=bool)
+    if numeric.any():
+        ary0, ary1 = [tbl.iloc[:, numeric].to_numpy(dtype=float) for tbl in [tbl0, tbl1]]
+        unequal[:, numeric] = _unequalArrays(ary0, ary1, rtol, atol)
+    if not numeric.all():
+        ary0, ary1 = [tbl.iloc[:, ~numeric].to_numpy(dtype=object) for tbl in [tbl0, tbl1]]
+        unequal[:, ~numeric] = _unequalArrays(ary0, ary1, rtol, atol)
+    return unequal
+
+
+def _unequalArrays(ary0, ary1, rtol, atol):
+    """
+    Like _unequalItems, but for two arrays of the same shape, compared with numpy.isclose if both are float arrays
+    and by equality otherwise.
+    """
+    if ary0.dtype.kind == 'f' and ary1.dtype.kind == 'f':
+        return ~np.isclose(ary0, ary1, rtol=rtol, atol=atol, equal_nan=True)
+    return ~((ary0 == ary1) | (pd.isnull(ary0) & pd.isnull(ary1)))
+
+
+def _splitRefs(entry):
+    """
+    Split a reference entry into its comma-separated keys, ignoring null entries.
+    """
+    if entry is None or entry == 'none' or (not isinstance(entry, str) and pd.isnull(entry)):
+        return []
+    return [key.strip() for key in str(entry).split(',') if key.strip() not in ('', 'none')]
+
+
+def _plain(tbl):
+    """
+    Return the table with any sparse or categorical columns (from the lowMemory option) converted back to plain
+    columns for writing.
+    """
+    special = [c for c in tbl.columns if isinstance(tbl[c].dtype, (pd.SparseDtype, pd.CategoricalDtype))]
+    if not special:
+        return tbl
+    tbl = tbl.copy()
+    for c in special:
+        tbl[c] = np.asarray(tbl[c])
+    return tbl
+
+
+def _columnHashes(tbl):
+    """
+    Dictionary of a digest of the contents of each column of a table: the sum (modulo 2**64) of the hashes of its items
+    combined with their row labels, which can be updated item by item as the table is edited.
+    """
+    labels = _hashLabels(tbl.index)
+    return dict((c, _hashSum(_hashableColumn(tbl[c]), labels)) for c in tbl.columns)
+
+
+def _hashableColumn(column):
+    """
+    The column with sparse and categorical data (from the lowMemory option) made plain, so that the hashes of its items
+    don't depend on how it happens to be stored.
+    """
+    if isinstance(column.dtype, (pd.SparseDtype, pd.CategoricalDtype)):
+        return pd.Series(np.asarray(column), index=column.index)
+    return column
+
+
+def _hashLabels(index):
+    """
+    Hashes of the row labels, to be combined with the hashes of the items in each column by _hashSum.
+    """
+    return _hashArray(index) * np.uint64(0x9E3779B97F4A7C15)
+
+
+def _hashSum(column, labels):
+    return int((_hashArray(column) ^ labels).sum(dtype=np.uint64))
+
+
+def _hashArray(data):
+    values = data.array if isinstance(data.dtype, pd.api.extensions.ExtensionDtype) else data.to_numpy()
+    return pd.util.hash_array(values)
+
+
+def _hasPending(path):
+    """
+    Whether the catalog at path has edits in its journal that aren't in its table files yet or a committed save that
+    hasn't been moved into place.
+    """
+    journalPath = os.path.join(path, SciCatalog.journalFile)
+    if os.path.exists(journalPath) and os.path.getsize(journalPath) > 0:
+        return True
+    return SciCatalog._readManifest(path)['staged'] is not None
+
+
+def _parseJournal(journalPath, generation):
+    """
+    Parse the journal at journalPath, stopping at an incomplete last line. Returns the list of edits and the number of
+    bytes of complete lines, or None for the edits if the journal belongs to a generation other than the given one.
+    """
+    ops, end = [], 0
+    with open(journalPath, 'rb') as f:
+        for line in f:
+            try:
+                item = json.loads(line.decode('utf-8'))
+            except ValueError:
+                break
+            end += len(line)
+            if isinstance(item, dict):
+                if item['generation'] != generation:
+                    return None, end
+            else:
+                ops.append(item)
+    return ops, end
+
+
+def _journalItems(path):
+    """
+    Items written by the edits in the journal of the catalog at path, as a list (one per table) of dictionaries keyed by
+    row label and then column label, with later edits overriding earlier ones. Returns None if the journal holds edits
+    that change the rows or columns of the tables, which can't be applied item by item, or the catalog has a save in
+    progress. Should be called with the catalog files locked.
+    """
+    manifest = SciCatalog._readManifest(path)
+    if manifest['staged'] is not None:
+        return None
+    items = [{} for _ in SciCatalog.keys]
+    journalPath = os.path.join(path, SciCatalog.journalFile)
+    if not os.path.exists(journalPath):
+        return items
+    ops, _ = _parseJournal(journalPath, manifest['generation'])
+    for op in ops or []:
+        name, args = op[0], op[1:]
+        if name == 'set':
+            # mirrors set: one of index and col may be a list, and None items are left alone
+            index, col, data = args[0], args[1], args[2:6]
+            if isinstance(index, list):
+                labels = [(i, col) for i in index]
+            elif isinstance(col, list):
+                labels = [(index, c) for c in col]
+            else:
+                labels, data = [(index, col)], [[d] for d in data]
+            for tblItems, tblData in zip(items, data):
+                for (i, c), item in zip(labels, tblData or []):
+                    if item is not None:
+                        tblItems.setdefault(i, {})[c] = item
+        elif name == 'update':
+            if args[6]:
+                # rows or columns may have been added
+                return None
+            for tblItems, block in zip(items, args[:4]):
+                if block is not None:
+                    block = _fromSplitDict(block)
+                    for c in block.columns:
+                        for i, item in zip(block.index, block[c].tolist()):
+                            tblItems.setdefault(i, {})[c] = item
+        elif name not in ['addRefEntry', 'removeRefEntries']:
+            return None
+    return items
+
+
+def _applyItems(tbl, items, ref=False):
+    """
+    Return a copy of tbl with the items from _journalItems that fall within it written in, or tbl itself if there are
+    none.
+    """
+    hits = []
+    for i, row in enumerate(tbl.index):
+        if row in items:
+            for c, item in items[row].items():
+                j = tbl.columns.get_indexer([c])[0]
+                if j >= 0:
+                    hits.append((i, j, item))
+    if not hits:
+        return tbl
+    data = tbl.to_numpy(dtype=object, copy=True)
+    for i, j, item in hits:
+        data[i, j] = item
+    new = pd.DataFrame(data, index=tbl.index, columns=tbl.columns)
+    return new if ref else new.infer_objects()
+
+
+def _fsync(path):
+    """
+    Flush a file or directory to the disk.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # directories can't be opened on some platforms (Windows), where there's nothing to be done
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _splitDict(tbl):
+    """
+    Dictionary of the labels and the data (column by column) of a table for writing to the journal, built with array
+    methods, which is much faster than DataFrame.to_dict for large tables. Read back with _fromSplitDict.
+    """
+    return dict(index=tbl.index.tolist(), columns=tbl.columns.tolist(),
+                columnData=[tbl.iloc[:, j].to_numpy().tolist() for j in range(tbl.shape[1])])
+
+
+def _fromSplitDict(d):
+    """
+    Rebuild a table from the output of _splitDict or (for journals written before it) DataFrame.to_dict('split').
+    """
+    if 'columnData' not in d:
+        return pd.DataFrame(**d)
+    data = dict((j, column) for j, column in enumerate(d['columnData']))
+    tbl = pd.DataFrame(data, index=d['index'], columns=range(len(d['columns'])))
+    tbl.columns = d['columns']
+    return tbl
+
+
+def _jsonable(x):
+    """
+    Convert numpy arrays and pandas Series and Indexes to lists, numpy scalars to python scalars, and null values to None
+    for writing to json.
+    """
+    if isinstance(x, (np.ndarray, pd.Series, pd.Index)):
+        # nan items stay nan, since None means "leave the item alone" to set
+        return [v if isinstance(v, float) else _jsonable(v) for v in x.tolist()]
+    if isinstance(x, np.generic):
+        x = x.item()
+    if pd.isnull(x):
+        return None
+    return x
 
 
 def quickval(path, index, col, key='value'):
@@ -472,9 +2203,136 @@ def quickval(path, index, col, key='value'):
     Grab the value for index/col from the catalog located at path without opening the full catalog. key can be one
     of ['value', 'errpos', 'errneg', 'ref'].
     """
-    i = SciCatalog.keys.index(key)
-    tblname = SciCatalog.tableFiles[i]
-    tblpath = os.path.join(path, tblname + '.' + SciCatalog.fileSuffix)
-    tbl = pd.read_csv(tblpath)
-    return tbl.loc[index, col]
+    return quickvals(path, [index], [col], key).iloc[0, 0]
+
+
+def quickvals(path, indices, cols, keys='value'):
+    """
+    Grab the items for the given lists of indices and cols from the catalog located at path without opening the full
+    catalog. Only the requested rows are read from csv tables that have an up to date row index (written every time
+    the catalog is saved). Items set by edits in the journal are written over those read from the table files. If the
+    journal holds edits that add or rename rows or columns or the catalog has a save in progress, the requested rows
+    and columns are instead read through a read only SciCatalog so that they come from a consistent state. If an up to
+    date copy of the catalog is in the cache (see the cache module), the items are taken from it.
+
+    Parameters
+    ----------
+    path : str
+        Path of the catalog directory.
+    indices, cols : list
+        Row and column labels of the items.
+    keys : str or list
+        One or more of ['value', 'errpos', 'errneg', 'ref'].
+
+    Returns
+    -------
+    A DataFrame with the given indices and cols as labels if keys is a single key, otherwise a dictionary of such
+    DataFrames keyed by key.
+    """
+    cat = cache.catalogs.peek(path)
+    if cat is None and _hasPending(path):
+        with _filesReadLocked(path):
+            items = _journalItems(path)
+            if items is not None:
+                return _lookup(path, indices, cols, keys, items)
+        cat = SciCatalog(path, readOnly=True, silent=True, index=list(indices), columns=list(cols))
+    if cat is not None:
+        result = dict((key, tbl.loc[list(indices), list(cols)]) for key, tbl in zip(SciCatalog.keys, cat.tables))
+        return result[keys] if isinstance(keys, str) else dict((key, result[key]) for key in keys)
+    return _lookup(path, indices, cols, keys)
+
+
+def _lookup(path, indices, cols, keys, items=None):
+    """
+    Read the items for quickvals from the table files, writing in the items from _journalItems if given.
+    """
+    result = {}
+    for key in ([keys] if isinstance(keys, str) else keys):
+        k = SciCatalog.keys.index(key)
+        backend = storage.detectBackend(path, SciCatalog.tableFiles[k])
+        tblpath = os.path.join(path, SciCatalog.tableFiles[k] + '.' + backend.suffix)
+        result[key] = backend.lookup(tblpath, list(indices), list(cols), ref=(key == 'ref'))
+        if items is not None:
+            result[key] = _applyItems(result[key], items[k], ref=(key == 'ref'))
+    return result[keys] if isinstance(keys, str) else result
+
+
+@contextmanager
+def _filesReadLocked(path):
+    """
+    Hold a shared lock on the files of the catalog at path, like SciCatalog._filesLocked, so that a save can't replace
+    them while they are read. Catalogs in directories where the lock file can't be created are read without it.
+    """
+    lock = locking.FileLock(os.path.join(path, SciCatalog.dataLockFile))
+    try:
+        lock.acquire(shared=True)
+    except (IOError, OSError):
+        lock = None
+    try:
+        yield
+    finally:
+        if lock is not None:
+            lock.release()
+
+
+def iterchunks(path, columns=None, chunksize=1000, labels=True):
+    """
+    Read the catalog at path a chunk of rows at a time, straight from its table files, yielding dictionaries of
+    values, errors, and reference keys ready to be passed to export.aastex_stream. This allows tables to be exported
+    from catalogs too large to comfortably hold in memory.
+
+    Parameters
+    ----------
+    path : str
+        Path of the catalog directory.
+    columns : list
+        Columns to read. Default is all of them.
+    chunksize : int
+        Number of rows per chunk.
+    labels : True|False
+        If True, the row labels are included as the first column of the values (with no errors or references).
+
+    Returns
+    -------
+    A generator of dictionaries with 'values', 'err', and 'refkeys' keys.
+    """
+    items = [{} for _ in SciCatalog.keys]
+    if _hasPending(path):
+        # the table files are missing the edits in the journal or are being replaced
+        with _filesReadLocked(path):
+            items = _journalItems(path)
+    if items is None:
+        cat = SciCatalog(path, readOnly=True, silent=True, columns=columns)
+        readers = [storage._iterSlices(tbl, chunksize) for tbl in cat.tables]
+        items = [{} for _ in SciCatalog.keys]
+    else:
+        readers = []
+        for name, key in zip(SciCatalog.tableFiles, SciCatalog.keys):
+            backend = storage.detectBackend(path, name)
+            tblpath = os.path.join(path, name + '.' + backend.suffix)
+            readers.append(backend.iterread(tblpath, columns=columns, chunksize=chunksize, ref=(key == 'ref')))
+
+    for chunks in zip(*readers):
+        if any(items):
+            chunks = [_applyItems(tbl, tblItems, ref=(key == 'ref'))
+                      for tbl, tblItems, key in zip(chunks, items, SciCatalog.keys)]
+        values, errpos, errneg, refs = chunks
+        vals, errn, errp, refkeys = [tbl.to_numpy(dtype=object).tolist() for tbl in [values, errneg, errpos, refs]]
+        if labels:
+            for i, lbl in enumerate(values.index):
+                vals[i].insert(0, str(lbl))
+                errn[i].insert(0, None)
+                errp[i].insert(0, None)
+                refkeys[i].insert(0, 'none')
+        yield dict(values=vals, err=[errn, errp], refkeys=refkeys)
+
+
+def convert(path, newpath, format):
+    """
+    Copy the catalog at path to a new catalog at newpath that stores its tables in the given format (one of the keys
+    of storage.backends). Use this to migrate catalogs between the csv and binary formats. The archive of backups is
+    not copied.
+    """
+    cat = SciCatalog(path, readOnly=True, silent=True)
+    return SciCatalog(newpath, cat.values, cat.errpos, cat.errneg, cat.refs, cat.refDict, format=format)
 
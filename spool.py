@@ -0,0 +1,252 @@
+"""
+A spool directory for gathering edits to a catalog from many processes. Workers submit updates to individual items
+with a SpoolWriter, which hands them off to the spool in files that appear atomically. A single committer then applies
+everything in the spool to the catalog in batches with commit (or serve, which keeps committing as more arrives).
+
+Example
+-------
+In each worker:
+
+>>> with SpoolWriter('stars') as spool:
+...     for star in mystars:
+...         spool.submit(star, 'Teff', *fit_teff(star))
+
+In the committer:
+
+>>> cat = SciCatalog('stars')
+>>> stats = commit(cat)
+"""
+from __future__ import division, print_function, absolute_import
+import os
+import time
+import json
+import socket
+import numpy as np
+import pandas as pd
+
+spoolDir = 'spool'
+fields = ['value', 'errpos', 'errneg', 'ref']
+
+
+class SpoolWriter:
+    """
+    Submits item updates for a catalog to its spool directory.
+
+    Parameters
+    ----------
+    path : str
+        Path of the catalog directory.
+    batchSize : int
+        Updates are handed off to the spool every batchSize submissions, as well as when flush is called or the
+        writer is used as a context manager and the block exits.
+    spool : str
+        Path of the spool directory. Default is the spool subdirectory of the catalog.
+    """
+    def __init__(self, path, batchSize=100, spool=None):
+        self.spool = os.path.join(path, spoolDir) if spool is None else spool
+        self.batchSize = batchSize
+        self._records = []
+        self._count = 0
+        if not os.path.exists(self.spool):
+            try:
+                os.mkdir(self.spool)
+            except OSError:
+                # another worker got there first
+                if not os.path.isdir(self.spool):
+                    raise
+
+    def submit(self, index, col, value=None, errpos=None, errneg=None, ref=None):
+        """
+        Submit an update to the item at index, col. As with SciCatalog.set, parts of the item given as None are left
+        as they are.
+        """
+        record = dict(index=index, col=col, value=value, errpos=errpos, errneg=errneg, ref=ref, time=time.time())
+        self._records.append(record)
+        if len(self._records) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        """
+        Hand the submitted updates off to the spool. The file of updates is written and flushed to the disk under a
+        temporary name and then renamed, so the committer never sees part of it.
+        """
+        if not self._records:
+            return
+        name = '{:020d}-{}-{}-{:06d}.jsonl'.format(time.time_ns(), socket.gethostname(), os.getpid(), self._count)
+        tmpPath = os.path.join(self.spool, '.' + name)
+        with open(tmpPath, 'w') as f:
+            for record in self._records:
+                f.write(json.dumps(record, default=_jsonable) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmpPath, os.path.join(self.spool, name))
+        self._records = []
+        self._count += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def commit(cat, onConflict='last', addMissing=False, maxFiles=None, spool=None):
+    """
+    Apply the updates waiting in the spool to the catalog and remove them from the spool.
+
+    The updates are applied with a single call to the catalog's update method, within a locked block if the catalog
+    was opened with holdLock=False. Spool files are only removed once the updates are written, so updates are never
+    lost, though they can be applied twice if the committer dies in between (which does no harm).
+
+    Parameters
+    ----------
+    cat : SciCatalog
+        The catalog, opened for editing.
+    onConflict : str or function
+        How to resolve several updates to the same item (and, for 'keep', updates to items that already have a value):
+            'last' : the most recently submitted update wins
+            'first' : the earliest submitted update wins
+            'keep' : items that already have a value in the catalog are left alone, otherwise the earliest update wins
+            'error' : raise a ValueError, leaving the spool untouched
+        or a function called as func(index, col, current, updates) that returns the update to apply (or None to leave
+        the item alone), where current is a dictionary of the item's value, errpos, errneg, and ref in the catalog
+        and updates is the list of update dictionaries in the order they were submitted.
+    addMissing : True|False
+        If True, rows and columns that are not in the catalog are added. Otherwise a KeyError is raised.
+    maxFiles : int
+        Commit at most this many spool files (the oldest), to bound the size of a batch.
+    spool : str
+        Path of the spool directory. Default is the spool subdirectory of the catalog.
+
+    Returns
+    -------
+    stats : dict
+        files, updates : number of spool files and updates read
+        items : number of catalog items changed
+        conflicts : number of items with more than one differing update (or an update to an item that already had a
+            value, for 'keep')
+        seconds : time spent
+        rate : updates committed per second
+    """
+    start = time.time()
+    spool = os.path.join(cat.path, spoolDir) if spool is None else spool
+    names = sorted(name for name in os.listdir(spool) if name.endswith('.jsonl') and not name.startswith('.')) \
+        if os.path.exists(spool) else []
+    if maxFiles is not None:
+        names = names[:maxFiles]
+
+    # gather the updates for each item in the order they were submitted. Files are named for when they were flushed,
+    # but a writer can flush an update made before one that another writer has already flushed, so the updates are
+    # put in order by the times they were made (ties keep the order of the files)
+    updates = {}
+    nupdates = 0
+    for name in names:
+        with open(os.path.join(spool, name)) as f:
+            for line in f:
+                record = json.loads(line)
+                updates.setdefault((record['index'], record['col']), []).append(record)
+                nupdates += 1
+    for records in updates.values():
+        records.sort(key=lambda record: record['time'])
+
+    nitems = nconflicts = 0
+    if updates:
+        with cat.locked():
+            chosen, nconflicts = _resolve(cat, updates, onConflict)
+            if chosen:
+                _apply(cat, chosen, addMissing)
+            nitems = len(chosen)
+
+    for name in names:
+        os.remove(os.path.join(spool, name))
+
+    seconds = time.time() - start
+    return dict(files=len(names), updates=nupdates, items=nitems, conflicts=nconflicts, seconds=seconds,
+                rate=nupdates/seconds if seconds > 0 else 0.)
+
+
+def serve(cat, interval=1.0, stop=None, **kws):
+    """
+    Keep committing updates from the spool to the catalog every interval seconds until stop() returns True (or
+    forever, if stop is None), then commit whatever is left. Keywords are passed to commit.
+
+    Returns
+    -------
+    stats : dict
+        The statistics returned by commit, totaled over all commits, plus the number of commits made.
+    """
+    total = dict(commits=0, files=0, updates=0, items=0, conflicts=0, seconds=0.)
+    while True:
+        done = stop is not None and stop()
+        stats = commit(cat, **kws)
+        total['commits'] += 1
+        for key in ['files', 'updates', 'items', 'conflicts', 'seconds']:
+            total[key] += stats[key]
+        if done:
+            break
+        if stats['files'] == 0:
+            time.sleep(interval)
+    total['rate'] = total['updates']/total['seconds'] if total['seconds'] > 0 else 0.
+    return total
+
+
+def _resolve(cat, updates, onConflict):
+    """
+    Pick the update to apply to each item, returning a dictionary of them keyed by (index, col) and the number of
+    conflicts.
+    """
+    chosen = {}
+    nconflicts = 0
+    for (index, col), records in updates.items():
+        distinct = set(json.dumps([r[f] for f in fields], default=_jsonable) for r in records)
+        conflict = len(distinct) > 1
+        inCat = index in cat.values.index and col in cat.values.columns
+        if callable(onConflict):
+            current = dict(zip(fields, [tbl.at[index, col] if inCat else None for tbl in cat.tables]))
+            record = onConflict(index, col, current, records) if conflict else records[-1]
+        elif onConflict == 'last':
+            record = records[-1]
+        elif onConflict == 'first':
+            record = records[0]
+        elif onConflict == 'keep':
+            record = records[0]
+            if inCat and not pd.isnull(cat.values.at[index, col]):
+                conflict, record = True, None
+        elif onConflict == 'error':
+            if conflict:
+                raise ValueError('There are {} different updates to item {}, {} in the spool.'
+                                 ''.format(len(distinct), index, col))
+            record = records[-1]
+        else:
+            raise ValueError("onConflict must be 'last', 'first', 'keep', 'error', or a function.")
+        nconflicts += conflict
+        if record is not None:
+            chosen[(index, col)] = record
+    return chosen, nconflicts
+
+
+def _apply(cat, chosen, addMissing):
+    """
+    Apply the chosen updates to the catalog with one call to its update method. Each table that has updates gets a
+    block spanning the rows and columns updated, filled in with the items already in the catalog where there aren't
+    any.
+    """
+    rows = pd.Index(pd.unique(np.array([index for index, _ in chosen], dtype=object)))
+    cols = pd.Index(pd.unique(np.array([col for _, col in chosen], dtype=object)))
+    blocks = []
+    for key, tbl, null in zip(fields, cat.tables, cat.nullValues):
+        items = [(index, col, record[key]) for (index, col), record in chosen.items() if record[key] is not None]
+        if not items:
+            blocks.append(None)
+            continue
+        block = tbl.reindex(index=rows, columns=cols, fill_value=null)
+        rowpos, colpos = rows.get_indexer([i[0] for i in items]), cols.get_indexer([i[1] for i in items])
+        data = block.to_numpy(dtype=object, copy=True)
+        data[rowpos, colpos] = [i[2] for i in items]
+        block = pd.DataFrame(data, index=rows, columns=cols)
+        blocks.append(block if key == 'ref' else block.infer_objects())
+    cat.update(*blocks, addMissing=addMissing)
+
+
+def _jsonable(x):
+    return x.item() if isinstance(x, np.generic) else str(x)
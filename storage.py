@@ -0,0 +1,352 @@
+"""
+Backends for reading and writing the individual tables of a SciCatalog. Each backend is a class with a file suffix
+and read and write classmethods. The catalog picks the backend from the files present in its directory when it is
+loaded or from the format keyword when it is created.
+"""
+from __future__ import division, print_function, absolute_import
+import os
+import csv
+import json
+import importlib
+import numpy as np
+import pandas as pd
+
+
+class CSVStorage:
+    """
+    Plain text, human-readable tables. This is the original SciCatalog format.
+
+    Each table file is accompanied by a small index file recording the byte offset of every row so that individual
+    items can be looked up without parsing the whole table.
+    """
+    format = 'csv'
+    suffix = 'csv'
+    indexSuffix = 'idx'
+
+    @classmethod
+    def read(cls, path, columns=None, rows=None, ref=False):
+        """
+        Read the table at path, optionally reading only the given columns and rows. If ref is True, the entries are
+        kept as strings exactly as written.
+        """
+        kws = cls._readArgs(path, columns, ref)
+        tbl = pd.read_csv(path, index_col=0, **kws)
+        if columns is not None:
+            tbl = tbl[list(columns)]
+        return _selectRows(tbl, rows)
+
+    @classmethod
+    def iterread(cls, path, columns=None, chunksize=1000, ref=False):
+        """
+        Read the table at path a chunk of rows at a time, yielding a DataFrame for each chunk.
+        """
+        kws = cls._readArgs(path, columns, ref)
+        for tbl in pd.read_csv(path, index_col=0, chunksize=chunksize, **kws):
+            yield tbl if columns is None else tbl[list(columns)]
+
+    @classmethod
+    def _readArgs(cls, path, columns, ref):
+        """
+        Keyword arguments to pandas.read_csv for reading the given columns of the table at path.
+        """
+        allcols = pd.read_csv(path, index_col=0, nrows=0).columns
+        kws = dict(float_precision='round_trip')
+        if columns is not None:
+            kws['usecols'] = [0] + [allcols.get_loc(c) + 1 for c in columns]
+            allcols = pd.Index(columns)
+        if ref:
+            kws['dtype'] = {c: str for c in allcols}
+            kws['keep_default_na'] = False
+        return kws
+
+    @classmethod
+    def write(cls, tbl, path):
+        tbl.to_csv(path)
+        cls._writeIndex(tbl, path)
+
+    @classmethod
+    def lookup(cls, path, rows, columns, ref=False):
+        """
+        Return a DataFrame of the items in the given rows and columns, reading only those rows from the disk if the
+        row index of the file is up to date.
+        """
+        idx = cls._readIndex(path)
+        if idx is None:
+            return cls.read(path, columns=columns, rows=rows, ref=ref)
+        offsets = dict(zip(idx['index'], idx['offsets']))
+        positions = []
+        for c in columns:
+            if c not in idx['columns']:
+                raise KeyError('Column {} is not in the table.'.format(c))
+            positions.append(idx['columns'].index(c) + 1)
+        data = []
+        with open(path, 'rb') as f:
+            for row in rows:
+                try:
+                    f.seek(offsets[str(row)])
+                except KeyError:
+                    raise KeyError('Row {} is not in the table.'.format(row))
+                line = next(csv.reader([f.readline().decode('utf-8')]))
+                items = [line[i] for i in positions]
+                data.append(items if ref else list(map(_parseItem, items)))
+        return pd.DataFrame(data, index=pd.Index(rows, dtype=object), columns=pd.Index(columns, dtype=object))
+
+    @classmethod
+    def _indexPath(cls, path):
+        return path + '.' + cls.indexSuffix
+
+    @classmethod
+    def _writeIndex(cls, tbl, path):
+        """
+        Record the byte offset of each row of the file at path, along with the file's size and modification time so
+        that an index made stale by editing the file by other means can be recognized.
+        """
+        idxpath = cls._indexPath(path)
+        labels = list(map(str, tbl.index))
+        linestarts = None
+        if not any('\n' in x or '"' in x for x in labels + list(map(str, tbl.columns))):
+            with open(path, 'rb') as f:
+                content = np.frombuffer(f.read(), dtype=np.uint8)
+            linestarts = np.flatnonzero(content == ord('\n')) + 1
+            returns = np.count_nonzero(content == ord('\r'))
+        if (linestarts is None or len(linestarts) != len(labels) + 1
+                or returns not in [0, len(linestarts)]):
+            # rows can't be found by line breaks if any item holds a line break (\r on its own, unless it ends every
+            # line), don't leave an old index lying around
+            if os.path.exists(idxpath):
+                os.remove(idxpath)
+            return
+        stat = os.stat(path)
+        idx = dict(size=stat.st_size, mtime=stat.st_mtime_ns, columns=list(map(str, tbl.columns)), index=labels,
+                   offsets=linestarts[:len(labels)].tolist())
+        with open(idxpath, 'w') as f:
+            json.dump(idx, f)
+
+    @classmethod
+    def _readIndex(cls, path):
+        """
+        Return the row index of the file at path or None if there isn't an up to date one.
+        """
+        idxpath = cls._indexPath(path)
+        if not os.path.exists(idxpath):
+            return None
+        with open(idxpath) as f:
+            idx = json.load(f)
+        stat = os.stat(path)
+        if idx['size'] != stat.st_size or idx['mtime'] != stat.st_mtime_ns:
+            return None
+        return idx
+
+
+class NPZStorage:
+    """
+    Binary tables stored column by column in uncompressed numpy .npz archives. Requires nothing beyond numpy. Floats
+    are stored exactly and individual columns can be read without reading the rest of the table.
+
+    Nothing is pickled. Columns of strings are stored as fixed-width unicode arrays, and columns mixing strings,
+    numbers, and nulls as unicode arrays of each item's text accompanied by an array of codes for the items' types.
+    """
+    format = 'npz'
+    suffix = 'npz'
+
+    # codes for the types of the items in mixed columns
+    _kinds = [str, float, int, bool, None]
+
+    @classmethod
+    def read(cls, path, columns=None, rows=None, ref=False):
+        with np.load(path, allow_pickle=False) as npz:
+            allcols = list(npz['columns'])
+            index = cls._readArray(npz, 'index')
+            if columns is None:
+                columns = allcols
+            positions = None
+            if rows is not None:
+                positions = _rowPositions(pd.Index(index), rows)
+                index = index[positions]
+            data = {}
+            for col in columns:
+                ary = cls._readArray(npz, 'c{}'.format(allcols.index(col)), positions)
+                data[col] = ary.astype(object) if ary.dtype.kind == 'U' else ary
+        return pd.DataFrame(data, index=pd.Index(index), columns=pd.Index(columns, dtype=object))
+
+    @classmethod
+    def lookup(cls, path, rows, columns, ref=False):
+        """
+        Return a DataFrame of the items in the given rows and columns. Only the row labels and the requested columns
+        are read from the archive.
+        """
+        return cls.read(path, columns=columns, rows=rows, ref=ref)
+
+    @classmethod
+    def iterread(cls, path, columns=None, chunksize=1000, ref=False):
+        return _iterSlices(cls.read(path, columns=columns, ref=ref), chunksize)
+
+    @classmethod
+    def write(cls, tbl, path):
+        arys = dict(columns=np.array(list(map(str, tbl.columns))))
+        cls._addArray(arys, 'index', tbl.index)
+        for i, col in enumerate(tbl.columns):
+            cls._addArray(arys, 'c{}'.format(i), tbl[col])
+        with open(path, 'wb') as f:
+            np.savez(f, **arys)
+
+    @classmethod
+    def _addArray(cls, arys, name, data):
+        """
+        Add a column or index to the dictionary of arrays to save, as an array that numpy can save without pickling
+        plus, for mixed data, the array of the items' type codes.
+        """
+        ary = np.asarray(data)
+        if ary.dtype.kind in 'biufcU':
+            arys[name] = ary
+            return
+        kinds = np.array([cls._kindOf(x) for x in ary], dtype=np.int8)
+        if (kinds == 0).all():
+            arys[name] = ary.astype(str)
+            return
+        arys[name] = np.array(['' if k == 4 else str(x) for x, k in zip(ary, kinds)], dtype=str)
+        arys['kinds_' + name] = kinds
+
+    @classmethod
+    def _kindOf(cls, x):
+        if isinstance(x, str):
+            return 0
+        if pd.isnull(x):
+            return 4
+        if isinstance(x, (bool, np.bool_)):
+            return 3
+        if isinstance(x, (int, np.integer)):
+            return 2
+        if isinstance(x, (float, np.floating)):
+            return 1
+        raise TypeError("Items of type {} can't be stored in the npz format. Use the csv or parquet format instead."
+                        "".format(type(x).__name__))
+
+    @classmethod
+    def _readArray(cls, npz, name, positions=None):
+        """
+        Read an array written by _addArray, restoring the items of mixed data to their types, optionally taking only
+        the items at the given positions.
+        """
+        try:
+            ary = npz[name]
+        except ValueError:
+            raise IOError('{} holds pickled objects, which are not read for safety. It was written by an older version '
+                          'of SciCatalog; rewrite it in the csv format with that version and convert it back.'
+                          ''.format(name))
+        if positions is not None:
+            ary = ary[positions]
+        if 'kinds_' + name not in npz.files:
+            return ary
+        kinds = npz['kinds_' + name]
+        if positions is not None:
+            kinds = kinds[positions]
+        items = np.empty(len(ary), dtype=object)
+        for k, kind in enumerate(cls._kinds):
+            sel = kinds == k
+            if not sel.any():
+                continue
+            if kind is None:
+                items[sel] = np.nan
+            elif kind is bool:
+                items[sel] = list(ary[sel] == 'True')
+            else:
+                items[sel] = list(map(kind, ary[sel]))
+        return items
+
+
+class ParquetStorage:
+    """
+    Binary tables in the Apache Parquet format. Requires pyarrow (or fastparquet).
+    """
+    format = 'parquet'
+    suffix = 'parquet'
+
+    @classmethod
+    def read(cls, path, columns=None, rows=None, ref=False):
+        tbl = pd.read_parquet(path, columns=None if columns is None else list(columns))
+        return _selectRows(tbl, rows)
+
+    @classmethod
+    def lookup(cls, path, rows, columns, ref=False):
+        return cls.read(path, columns=columns, rows=rows, ref=ref)
+
+    @classmethod
+    def iterread(cls, path, columns=None, chunksize=1000, ref=False):
+        return _iterSlices(cls.read(path, columns=columns, ref=ref), chunksize)
+
+    @classmethod
+    def write(cls, tbl, path):
+        tbl.to_parquet(path)
+
+    @classmethod
+    def checkAvailable(cls):
+        """
+        Raise an ImportError if neither of the libraries pandas can use for parquet files is installed.
+        """
+        for module in ['pyarrow', 'fastparquet']:
+            try:
+                importlib.import_module(module)
+                return
+            except ImportError:
+                pass
+        raise ImportError('The parquet format requires pyarrow or fastparquet, and neither is installed.')
+
+
+backends = dict((b.format, b) for b in [CSVStorage, NPZStorage, ParquetStorage])
+
+
+def getBackend(format):
+    """
+    Return the storage backend for the given format name (one of the keys of storage.backends), raising an
+    ImportError if the libraries it needs aren't installed.
+    """
+    try:
+        backend = backends[format]
+    except KeyError:
+        raise ValueError('Storage format {} not understood. Must be one of {}.'.format(format, list(backends)))
+    if hasattr(backend, 'checkAvailable'):
+        backend.checkAvailable()
+    return backend
+
+
+def _parseItem(item):
+    """
+    Convert an item from a csv file as pandas would: empty means null, otherwise a float if possible.
+    """
+    if item == '':
+        return np.nan
+    try:
+        return float(item)
+    except ValueError:
+        return item
+
+
+def _iterSlices(tbl, chunksize):
+    for i in range(0, len(tbl), chunksize):
+        yield tbl.iloc[i:i+chunksize]
+
+
+def _rowPositions(index, rows):
+    positions = index.get_indexer(rows)
+    if (positions < 0).any():
+        missing = [r for r, i in zip(rows, positions) if i < 0]
+        raise KeyError('Rows {} are not in the table.'.format(missing))
+    return positions
+
+
+def _selectRows(tbl, rows):
+    if rows is None:
+        return tbl
+    return tbl.iloc[_rowPositions(tbl.index, rows)]
+
+
+def detectBackend(path, name):
+    """
+    Return the backend of the table with file name (sans suffix) name in the catalog directory at path, based on
+    which file exists.
+    """
+    for backend in backends.values():
+        if os.path.exists(os.path.join(path, name) + '.' + backend.suffix):
+            return backend
+    raise IOError('No {} table file of a recognized format found in {}.'.format(name, path))
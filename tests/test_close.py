@@ -0,0 +1,88 @@
+"""
+Tests of what close saves: edits made directly to the tables, which aren't journaled, but never the stale tables of a
+catalog that other processes have edited since.
+"""
+from __future__ import division, print_function, absolute_import
+import os
+import sys
+import warnings
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+
+# the repository directory is the package, so import it by name from its parent directory
+pkgdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(pkgdir))
+scicatalog = importlib.import_module(os.path.basename(pkgdir))
+SciCatalog = scicatalog.SciCatalog
+
+index, columns = ['a', 'b', 'c'], ['x', 'y']
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'cat')
+    values = pd.DataFrame([[1., 2.], [3., np.nan], [5., 6.]], index=index, columns=columns)
+    SciCatalog(path, values, index=index, columns=columns, silent=True).close()
+    return path
+
+
+def read(path):
+    return SciCatalog(path, readOnly=True, silent=True)
+
+
+@pytest.mark.parametrize('lowMemory', [False, True])
+def test_direct_edits_saved(path, lowMemory):
+    cat = SciCatalog(path, silent=True, lowMemory=lowMemory)
+    cat.set('a', 'x', 10.)
+    cat.values.loc['b', 'y'] = 20.
+    cat.refDict['k'] = 'A reference'
+    cat.close()
+    cat = read(path)
+    assert cat.values.at['a', 'x'] == 10. and cat.values.at['b', 'y'] == 20.
+    assert cat.refDict['k'] == 'A reference'
+
+
+def test_direct_edit_to_edited_item_saved(path):
+    cat = SciCatalog(path, silent=True)
+    cat.values.loc['a', 'x'] = 7.
+    cat.set(['a', 'b'], 'y', [8., 9.])
+    cat.addRow('d')
+    cat.close()
+    assert read(path).values.loc['a'].tolist() == [7., 8.]
+
+
+@pytest.mark.parametrize('lowMemory', [False, True])
+def test_api_edits_not_saved_in_full(path, lowMemory):
+    cat = SciCatalog(path, silent=True, lowMemory=lowMemory)
+    generation = cat.generation
+    cat.set('a', 'x', 10.)
+    cat.update(pd.DataFrame({'y': [0.5]}, index=['c']))
+    cat.addCols(['z'], values=pd.DataFrame({'z': [1., 2., 3.]}, index=index))
+    cat.renameRow('b', 'bb')
+    cat.renameCol('y', 'yy')
+    cat.addRefEntry('k', 'A reference')
+    cat.derive('sum', lambda x, z: x + z, ['x', 'z'])
+    cat.set(['a', 'c'], 'z', errpos=[0.1, 0.2], ref=['k', 'none'])
+    with pytest.raises(KeyError):
+        with cat.batch():
+            cat.set('a', 'x', 20.)
+            cat.set('e', 'x', 1.)
+    cat.close()
+    cat = read(path)
+    assert cat.generation == generation
+    assert cat.values.at['a', 'x'] == 10. and cat.values.at['bb', 'z'] == 2. and cat.values.at['c', 'yy'] == 0.5
+
+
+def test_workers_without_held_locks(path):
+    w1, w2 = [SciCatalog(path, silent=True, holdLock=False) for _ in range(2)]
+    with w1.locked():
+        w1.set('a', 'x', 10.)
+    with w2.locked():
+        w2.set('b', 'x', 30.)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        w1.close()
+        w2.close()
+    assert read(path).values['x'].tolist() == [10., 30., 5.]
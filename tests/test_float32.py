@@ -0,0 +1,57 @@
+"""
+Tests of editing and reopening catalogs held in single precision (the float32 option).
+"""
+from __future__ import division, print_function, absolute_import
+import os
+import sys
+import warnings
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+
+# the repository directory is the package, so import it by name from its parent directory
+pkgdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(pkgdir))
+scicatalog = importlib.import_module(os.path.basename(pkgdir))
+SciCatalog = scicatalog.SciCatalog
+
+index, columns = ['a', 'b', 'c'], ['x', 'y']
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'cat')
+    values = pd.DataFrame([[1., 2.], [3., np.nan], [5., 6.]], index=index, columns=columns)
+    SciCatalog(path, values, values/10, values/10, index=index, columns=columns, silent=True).close()
+    return path
+
+
+def test_replay_update(path):
+    cat = SciCatalog(path, silent=True)
+    cat.update(pd.DataFrame([[1.1, 2.2]], index=['b'], columns=columns), errpos=pd.DataFrame({'y': [0.3]}, index=['c']))
+    cat.set('a', 'x', 0.1)
+    cat.close()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        cat = SciCatalog(path, readOnly=True, silent=True, float32=True)
+    assert all(cat.values.dtypes == np.float32) and all(cat.errpos.dtypes == np.float32)
+    assert np.allclose(cat.values.loc['b'], [1.1, 2.2])
+    assert np.isclose(cat.values.at['a', 'x'], 0.1)
+    assert np.isclose(cat.errpos.at['c', 'y'], 0.3)
+
+
+def test_edits_in_memory(path):
+    cat = SciCatalog(path, readOnly=True, silent=True, float32=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        cat.update(pd.DataFrame({'x': [7.7]}, index=['c']))
+        cat.addRows(['d'], values=[[8., 9.]])
+        cat.addCols(['z'], values=pd.DataFrame({'z': [1., 2., 3., 4.]}, index=index + ['d']))
+        cat.derive('sum', lambda x, y: x + y, ['x', 'y'])
+    for tbl in cat.tables[:3]:
+        assert all(tbl.dtypes == np.float32)
+    assert np.isclose(cat.values.at['c', 'x'], 7.7)
+    assert np.allclose(cat.values.loc['d', ['x', 'y', 'z']], [8., 9., 4.])
+    assert np.isclose(cat.values.at['d', 'sum'], 17.)
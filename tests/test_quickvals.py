@@ -0,0 +1,73 @@
+"""
+Tests of reading items straight from the table files of catalogs with edits in their journal, which quickvals and
+iterchunks write over the items read from the files.
+"""
+from __future__ import division, print_function, absolute_import
+import os
+import sys
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+
+# the repository directory is the package, so import it by name from its parent directory
+pkgdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(pkgdir))
+scicatalog = importlib.import_module(os.path.basename(pkgdir))
+SciCatalog = scicatalog.SciCatalog
+
+index, columns = ['a', 'b', 'c'], ['x', 'y']
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'cat')
+    values = pd.DataFrame([[1., 2.], [3., np.nan], [5., 6.]], index=index, columns=columns)
+    SciCatalog(path, values, index=index, columns=columns, silent=True).close()
+    return path
+
+
+def check(path, monkeypatch=None):
+    """
+    Check that quickvals and iterchunks give the same items as opening the catalog, without opening it if
+    monkeypatch is given.
+    """
+    cat = SciCatalog(path, readOnly=True, silent=True)
+    if monkeypatch is not None:
+        def fail(*args, **kws):
+            raise AssertionError('the catalog was opened')
+        monkeypatch.setattr(SciCatalog, '__init__', fail)
+    result = scicatalog.quickvals(path, cat.values.index, cat.values.columns, keys=list(SciCatalog.keys))
+    chunks = list(scicatalog.iterchunks(path, chunksize=2, labels=False))
+    for key, tbl in zip(SciCatalog.keys, cat.tables):
+        pd.testing.assert_frame_equal(result[key], tbl, check_dtype=False, check_index_type=False,
+                                      check_column_type=False)
+    values = sum([chunk['values'] for chunk in chunks], [])
+    refkeys = sum([chunk['refkeys'] for chunk in chunks], [])
+    np.testing.assert_array_equal(np.array(values, float), cat.values.to_numpy())
+    assert refkeys == cat.refs.to_numpy(dtype=object).tolist()
+
+
+def test_item_edits_applied(path, monkeypatch):
+    cat = SciCatalog(path, silent=True)
+    cat.addRefEntry('k', 'A reference')
+    cat.set('a', 'x', 10., 0.5, 0.25, 'k')
+    cat.set(['b', 'c'], 'y', [20., None], ref=['k', 'none'])
+    cat.set('c', ['x', 'y'], [np.nan, 30.])
+    values = pd.DataFrame([[40.]], index=['b'], columns=['x'])
+    cat.update(values, errpos=values/10.)
+    cat.close()
+    assert os.path.getsize(os.path.join(path, SciCatalog.journalFile)) > 0
+    check(path, monkeypatch)
+    assert scicatalog.quickval(path, 'b', 'x') == 40.
+
+
+def test_structural_edits_applied(path):
+    cat = SciCatalog(path, silent=True)
+    cat.set('a', 'x', 10.)
+    cat.addRows(['d'])
+    cat.renameCol('y', 'z')
+    cat.set('d', 'z', 7.)
+    cat.close()
+    check(path)
+    assert scicatalog.quickval(path, 'd', 'z') == 7.
@@ -0,0 +1,41 @@
+"""
+Tests of looking up items in csv tables through their row index.
+"""
+from __future__ import division, print_function, absolute_import
+import os
+import sys
+import importlib
+import pandas as pd
+import pytest
+
+# the repository directory is the package, so import it by name from its parent directory
+pkgdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(pkgdir))
+storage = importlib.import_module(os.path.basename(pkgdir) + '.storage')
+CSVStorage = storage.CSVStorage
+
+
+def write(tmp_path, y):
+    path = str(tmp_path / 'values.csv')
+    tbl = pd.DataFrame({'x': [1., 2., 3.], 'y': y}, index=['a', 'b', 'c'])
+    CSVStorage.write(tbl, path)
+    return path
+
+
+@pytest.mark.parametrize('item', ['multi\nline', 'multi\r\nline'])
+def test_multiline_items(tmp_path, item):
+    path = write(tmp_path, [item, 'q"uote', '6'])
+    assert not os.path.exists(CSVStorage._indexPath(path))
+    tbl = CSVStorage.lookup(path, ['c', 'a'], ['y'], ref=True)
+    assert tbl['y'].tolist() == ['6', item]
+
+
+def test_lookup(tmp_path):
+    path = write(tmp_path, ['one', 'q"uote', 'three'])
+    assert os.path.exists(CSVStorage._indexPath(path))
+    tbl = CSVStorage.lookup(path, ['c', 'b'], ['y', 'x'])
+    assert tbl.values.tolist() == [['three', 3.], ['q"uote', 2.]]
+    with pytest.raises(KeyError):
+        CSVStorage.lookup(path, ['a'], ['z'])
+    with pytest.raises(KeyError):
+        CSVStorage.lookup(path, ['d'], ['x'])
@@ -0,0 +1,258 @@
+"""
+Selections of the rows and columns of a catalog, narrowed down by conditions on the values, errors, references, and
+missing items. A view stores only the labels of the selected rows and columns, so making one (or a chain of them)
+costs next to nothing no matter how large the catalog is. Items are taken from the catalog's tables only when a table
+of the view is accessed, and then only the selected part of the one table asked for.
+
+Example
+-------
+>>> near = cat.query({'distance': dict(snr=5, refs=['a', 'b'])}, cols=['distance', 'Teff'])
+>>> near.values
+>>> bright = cat.mask('Vmag', max=6) | cat.mask('Jmag', max=5)
+>>> cat.select(bright).refs
+"""
+from __future__ import division, print_function, absolute_import
+import numpy as np
+import pandas as pd
+
+
+class CatalogView:
+    """
+    A read only selection of the rows and columns of a catalog. Edits made to the catalog show up in the view (as
+    long as the selected rows and columns are still there). Treat the tables returned by a view as read only: they
+    are the catalog's own tables if nothing has been selected away and copies of the selected parts otherwise.
+
+    Parameters
+    ----------
+    catalog : SciCatalog
+        The catalog to select from.
+    rows : list or boolean array
+        Labels of the rows to select, or a boolean mask over the rows of the catalog. Default is all rows.
+    cols : str or list
+        Names of the columns to select. Default is all columns.
+    """
+    def __init__(self, catalog, rows=None, cols=None):
+        self.catalog = catalog
+        self._rows = None
+        self._cols = None
+        self._rows = self._rowLabels(rows)
+        if cols is not None:
+            self._cols = self._colLabels(cols)
+
+    @property
+    def index(self):
+        """
+        Index of the selected rows.
+        """
+        return self.catalog.values.index if self._rows is None else self._rows
+
+    @property
+    def columns(self):
+        """
+        Index of the selected columns.
+        """
+        return self.catalog.values.columns if self._cols is None else self._cols
+
+    @property
+    def indices(self):
+        return list(self.index)
+
+    @property
+    def colnames(self):
+        return list(self.columns)
+
+    @property
+    def refDict(self):
+        return self.catalog.refDict
+
+    @property
+    def tables(self):
+        """
+        List of the selected parts of the values, errpos, errneg, and refs tables.
+        """
+        return [self._table(i) for i in range(len(self.catalog.keys))]
+
+    values = property(lambda self: self._table(0), doc="DataFrame of the selected values.")
+    errpos = property(lambda self: self._table(1), doc="DataFrame of the selected positive errors.")
+    errneg = property(lambda self: self._table(2), doc="DataFrame of the selected negative errors.")
+    refs = property(lambda self: self._table(3), doc="DataFrame of the selected reference keys.")
+
+    def __getitem__(self, col):
+        column = self.catalog.values[col]
+        return column if self._rows is None else column.loc[self._rows]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return '<view of {} rows x {} columns of the {} catalog>'.format(len(self), len(self.columns),
+                                                                           self.catalog.name)
+
+    def select(self, rows=None, cols=None):
+        """
+        Return a view of some of the rows and columns of this one. rows can be a list of labels or a boolean mask
+        over the rows of this view (such as the Series returned by mask), cols a column name or list of names.
+        """
+        view = CatalogView(self.catalog)
+        view._rows = self._rowLabels(rows)
+        view._cols = self._cols if cols is None else self._colLabels(cols)
+        return view
+
+    def query(self, where=None, cols=None):
+        """
+        Return a view of the rows that meet every one of a set of conditions, keeping the given columns (default is
+        all of them).
+
+        Parameters
+        ----------
+        where : dict or boolean array
+            Dictionary of the conditions on each column, as dictionaries of keywords for mask, e.g.
+            {'distance': dict(snr=5, refs=['a', 'b']), 'Teff': dict(min=3000)}. Alternatively, a boolean mask over the
+            rows.
+        cols : str or list
+            Columns to keep in the view.
+
+        Returns
+        -------
+        CatalogView
+        """
+        if where is None or not isinstance(where, dict):
+            return self.select(where, cols)
+        keep = np.ones(len(self), bool)
+        for col, conditions in where.items():
+            keep &= self.mask(col, **conditions).to_numpy()
+        return self.select(keep, cols)
+
+    def mask(self, col, min=None, max=None, snr=None, relErr=None, refs=None, null=None, hasErr=None):
+        """
+        Return a boolean Series over the selected rows marking those whose item in column col meets all of the given
+        conditions. Masks can be combined with &, |, and ~ and passed to select or query.
+
+        Parameters
+        ----------
+        col : str
+            Column to test.
+        min, max : float
+            Inclusive bounds on the value.
+        snr : float
+            Least signal-to-noise ratio, the absolute value divided by the larger of the two errors.
+        relErr : float
+            Greatest relative error, the larger of the two errors divided by the absolute value.
+        refs : str or list
+            Reference keys, at least one of which the item must cite.
+        null : True|False
+            Whether the value must be missing (True) or present (False).
+        hasErr : True|False
+            Whether the item must have (True) or lack (False) at least one error.
+
+        Returns
+        -------
+        pandas Series of bools
+        """
+        keep = np.ones(len(self), bool)
+        if null is not None:
+            keep &= pd.isnull(self._column(0, col, numeric=False)) == null
+        if min is not None or max is not None or snr is not None or relErr is not None:
+            value = self._column(0, col)
+            with np.errstate(invalid='ignore'):
+                if min is not None:
+                    keep &= value >= min
+                if max is not None:
+                    keep &= value <= max
+        if snr is not None or relErr is not None or hasErr is not None:
+            errpos, errneg = self._column(1, col), self._column(2, col)
+            if hasErr is not None:
+                keep &= (~np.isnan(errpos) | ~np.isnan(errneg)) == hasErr
+            if snr is not None or relErr is not None:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    err = np.fmax(errpos, errneg)
+                    if snr is not None:
+                        keep &= np.abs(value) >= snr*err
+                    if relErr is not None:
+                        keep &= err <= relErr*np.abs(value)
+        if refs is not None:
+            keep &= self._cites(col, [refs] if isinstance(refs, str) else refs)
+        return pd.Series(keep, index=self.index, name=col)
+
+    def copy(self, path, format=None):
+        """
+        Write the selection to the disk as a new catalog (with the full reference dictionary) and return it.
+        """
+        from .scicatalog import SciCatalog
+        if format is None:
+            format = self.catalog.format
+        return SciCatalog(path, *self.tables, refDict=self.refDict, format=format)
+
+    def _rowLabels(self, rows):
+        """
+        Labels of the rows picked from this view by a list of labels or a boolean mask, None meaning all of them.
+        """
+        if rows is None:
+            return self._rows
+        if isinstance(rows, pd.Series) and rows.dtype == bool:
+            rows = rows.reindex(self.index, fill_value=False).to_numpy()
+        rows = np.asarray(rows) if not isinstance(rows, pd.Index) else rows
+        if rows.dtype == bool:
+            if len(rows) != len(self):
+                raise ValueError('The mask has {} items, but there are {} rows in the selection.'
+                                 ''.format(len(rows), len(self)))
+            return self.index[rows]
+        rows = pd.Index(rows)
+        missing = rows.difference(self.index)
+        if len(missing):
+            raise KeyError('Rows {} are not in the selection.'.format(list(missing)))
+        return rows
+
+    def _colLabels(self, cols):
+        """
+        Index of the columns picked from this view by a column name or list of names.
+        """
+        cols = pd.Index([cols] if isinstance(cols, str) else list(cols))
+        missing = cols.difference(self.columns)
+        if len(missing):
+            raise KeyError('Columns {} are not in the selection.'.format(list(missing)))
+        return cols
+
+    def _positions(self):
+        """
+        Positions of the selected rows in the catalog's tables, or None for all of them.
+        """
+        return None if self._rows is None else self.catalog.values.index.get_indexer(self._rows)
+
+    def _column(self, i, col, numeric=True):
+        """
+        Column col of table i for the selected rows as a numpy array, converted to floats (with anything that isn't a
+        number as nan) if numeric. Only the selected items are copied.
+        """
+        column = self.catalog._table(i)[col]
+        if isinstance(column.dtype, pd.SparseDtype):
+            column = column.sparse.to_dense()
+        values = column.to_numpy()
+        pos = self._positions()
+        values = values if pos is None else values[pos]
+        if not numeric:
+            return values
+        if values.dtype.kind in 'fiub':
+            return values.astype(float, copy=False)
+        return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+
+    def _cites(self, col, refkeys):
+        """
+        Boolean array marking the selected items of column col citing any of refkeys. Each distinct reference entry
+        is split only once.
+        """
+        from .scicatalog import _splitRefs
+        refkeys = set(refkeys)
+        codes, entries = pd.factorize(self.catalog._table(3)[col])
+        cites = np.array([bool(refkeys.intersection(_splitRefs(entry))) for entry in entries] + [False])
+        pos = self._positions()
+        codes = codes if pos is None else codes[pos]
+        return cites[codes]
+
+    def _table(self, i):
+        tbl = self.catalog._table(i)
+        if self._rows is None and self._cols is None:
+            return tbl
+        rows = slice(None) if self._rows is None else self._rows
+        cols = slice(None) if self._cols is None else self._cols
+        return tbl.loc[rows, cols]